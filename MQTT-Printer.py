@@ -1,7 +1,74 @@
 #!/usr/bin/env python3
-import argparse, json, sys
+import argparse, json, math, struct, sys
+from datetime import datetime, timezone
 import paho.mqtt.client as mqtt
 
+# Optional decoders for WeatherDataFetcher's binary encodings (PAYLOAD_ENCODING)
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+CBOR_TAG_FLOAT32_LE = 85  # RFC 8746 typed array: float32, little endian
+
+def iso(epoch, ms=False):
+    if epoch is None:
+        return None
+    dt = datetime.fromtimestamp(epoch / 1000 if ms else epoch, timezone.utc)
+    return dt.isoformat(timespec="milliseconds" if ms else "seconds").replace("+00:00", "Z")
+
+def unpack_float32(raw):
+    if cbor2 is not None and isinstance(raw, cbor2.CBORTag) and raw.tag == CBOR_TAG_FLOAT32_LE:
+        raw = raw.value
+    vals = struct.unpack(f"<{len(raw) // 4}f", raw)
+    return [None if math.isnan(v) else round(v, 6) for v in vals]
+
+def expand_compact(obj):
+    """Readable dict (ISO times, plain value lists) from a compact binary message."""
+    out = {"messageid": iso(obj.get("id"), ms=True)}
+    if "ts" in obj:
+        out["timestamp"] = iso(obj["ts"], ms=True)
+    if "t0" in obj and "kf" not in obj:
+        n = max((len(unpack_float32(s["v"])) for s in obj["s"].values()), default=0)
+        out["timeindex"] = [iso(obj["t0"] + i * obj["dt"]) for i in range(n)]
+    elif "t" in obj:
+        out["timeindex"] = [iso(t) for t in obj["t"]]
+    elif "kf" in obj:
+        out.update(keyframeId=iso(obj["kf"], ms=True), start=iso(obj["t0"]), hours=obj["h"])
+    series = {}
+    for name, s in obj.get("s", {}).items():
+        if "c" in s:
+            series[name] = {"unit": s["u"], "changes": {iso(t): v for t, v in s["c"].items()}}
+        elif isinstance(s.get("v"), (bytes, bytearray)) or (cbor2 and isinstance(s.get("v"), cbor2.CBORTag)):
+            series[name] = {"unit": s["u"], "values": unpack_float32(s["v"])}
+        else:
+            series[name] = {"unit": s["u"], "value": s["v"]}
+            if "ts" in s:  # combined measurement: per-series time and station
+                series[name].update(timestamp=iso(s["ts"], ms=True), location=s.get("loc"))
+                if "fb" in s:
+                    series[name]["fallbackStation"] = s["fb"]
+    out["series"] = series
+    for key, val in obj.items():
+        if key not in ("id", "ts", "t0", "dt", "t", "kf", "h", "s"):
+            out[{"loc": "location", "fb": "fallbackStation"}.get(key, key)] = val
+    return out
+
+def decode_binary(topic, payload):
+    """Decode a '/cbor' or '/msgpack' topic's payload; None if not a binary topic."""
+    if topic.endswith("/cbor"):
+        if cbor2 is None:
+            raise RuntimeError("cbor2 not installed (pip install cbor2)")
+        return expand_compact(cbor2.loads(payload))
+    if topic.endswith("/msgpack"):
+        if msgpack is None:
+            raise RuntimeError("msgpack not installed (pip install msgpack)")
+        return expand_compact(msgpack.unpackb(payload, raw=False, strict_map_key=False))
+    return None
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--host", default="broker")
@@ -25,7 +92,9 @@ def main():
 
     def on_message(c, u, msg):
         try:
-            obj = json.loads(msg.payload.decode("utf-8"))
+            obj = decode_binary(msg.topic, msg.payload)
+            if obj is None:
+                obj = json.loads(msg.payload.decode("utf-8"))
             print(json.dumps(obj, ensure_ascii=False), flush=True)
         except Exception:
             print(msg.payload.decode("utf-8", errors="replace"), flush=True)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+RegressionCheck.py — check that the fast paths of WeatherDataFetcher.py still
+produce the same output as the straightforward code they replaced.
+
+  * render_json() (precompiled MessageTemplates) against json.dumps() of the
+    same message, for every builder (measurements through their templates,
+    forecasts serialized whole), including NaN, None, non-ASCII and quoted
+    strings and empty series.
+  * The streaming parser (parse_timevaluepairs, parse_timevaluepairs_columnar
+    and latest_value / bucket_hourly on its Series) against the original
+    ElementTree findall() parser, kept below as the reference.
+
+No network or broker needed. Prints every mismatch and exits 1 if there was any.
+
+Usage:
+  python RegressionCheck.py
+"""
+
+import json
+import sys
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, urlparse
+
+import WeatherDataFetcher as wdf
+
+
+# --- Reference parser (before the streaming parser) ---------------------------
+
+def ref_parse_timevaluepairs(xml_bytes: bytes, with_station: bool = False) -> List[Dict[str, Any]]:
+    root = ET.fromstring(xml_bytes)
+    out: List[Dict[str, Any]] = []
+    for member in root.findall(".//wfs:member", wdf.NS):
+        fmisid = ""
+        if with_station:
+            for ident in member.iterfind(".//gml:identifier", wdf.NS):
+                if ident.get("codeSpace") == wdf.FMISID_CODESPACE and ident.text:
+                    fmisid = ident.text.strip()
+                    break
+        prop = member.find(".//om:observedProperty", wdf.NS)
+        href = prop.get("{%s}href" % wdf.NS["xlink"]) if prop is not None else ""
+        param_code = ""
+        if href:
+            try:
+                param_code = parse_qs(urlparse(href).query).get("param", [""])[0]
+            except Exception:
+                pass
+        for tvp in member.findall(".//wml2:MeasurementTVP", wdf.NS):
+            t_el = tvp.find("wml2:time", wdf.NS)
+            v_el = tvp.find("wml2:value", wdf.NS)
+            if t_el is None or v_el is None or v_el.text is None:
+                continue
+            try:
+                t = datetime.fromisoformat(t_el.text.replace("Z", "+00:00")).astimezone(timezone.utc)
+                v = float(v_el.text)
+            except Exception:
+                continue
+            row = {"param": param_code, "time": t, "value": v}
+            if with_station:
+                row["fmisid"] = fmisid
+            out.append(row)
+    return out
+
+
+def ref_latest_value(rows: List[Dict[str, Any]], param: str):
+    vals = [r for r in rows if r["param"] == param and r["value"] == r["value"]]
+    return max(vals, key=lambda r: r["time"]) if vals else None
+
+
+def ref_bucket_hourly(rows: List[Dict[str, Any]], param: str) -> Dict[datetime, float]:
+    d: Dict[datetime, float] = {}
+    for r in rows:
+        if r["param"] == param:
+            d[r["time"].replace(minute=0, second=0, microsecond=0)] = r["value"]
+    return d
+
+
+# --- Inputs -------------------------------------------------------------------
+
+_HEAD = ('<?xml version="1.0" encoding="UTF-8"?>'
+         '<wfs:FeatureCollection xmlns:wfs="http://www.opengis.net/wfs/2.0" xmlns:om="http://www.opengis.net/om/2.0"'
+         ' xmlns:omso="http://inspire.ec.europa.eu/schemas/omso/3.0" xmlns:gml="http://www.opengis.net/gml/3.2"'
+         ' xmlns:wml2="http://www.opengis.net/waterml/2.0" xmlns:xlink="http://www.w3.org/1999/xlink"'
+         ' xmlns:target="http://xml.fmi.fi/namespace/om/atmosphericfeatures/1.1"'
+         ' xmlns:sams="http://www.opengis.net/samplingSpatial/2.0" xmlns:sam="http://www.opengis.net/sampling/2.0">')
+
+
+def tvp_member(fmisid: str, param: str, points: List[tuple]) -> str:
+    """One wfs:member as FMI's timevaluepair queries return it."""
+    pts = "".join(f"<wml2:point><wml2:MeasurementTVP>"
+                  f"<wml2:time>{t}</wml2:time>{'' if v is None else f'<wml2:value>{v}</wml2:value>'}"
+                  f"</wml2:MeasurementTVP></wml2:point>" for t, v in points)
+    return (f'<wfs:member><omso:PointTimeSeriesObservation gml:id="obs-{fmisid}-{param}">'
+            f'<om:observedProperty xlink:href="https://opendata.fmi.fi/meta?observableProperty=observation'
+            f'&amp;param={param}&amp;language=eng"/>'
+            f'<om:featureOfInterest><sams:SF_SpatialSamplingFeature gml:id="s-{fmisid}"><sam:sampledFeature>'
+            f'<target:LocationCollection gml:id="lc-{fmisid}"><target:member><target:Location gml:id="l-{fmisid}">'
+            f'<gml:identifier codeSpace="{wdf.FMISID_CODESPACE}">{fmisid}</gml:identifier>'
+            f'<gml:name codeSpace="{wdf.LOCNAME_CODESPACE}">Station {fmisid}</gml:name>'
+            f'</target:Location></target:member></target:LocationCollection></sam:sampledFeature>'
+            f'<sams:shape><gml:Point gml:id="p-{fmisid}"><gml:pos>61.7 27.3 </gml:pos></gml:Point></sams:shape>'
+            f'</sams:SF_SpatialSamplingFeature></om:featureOfInterest>'
+            f'<om:result><wml2:MeasurementTimeseries gml:id="ts-{fmisid}-{param}">{pts}'
+            f'</wml2:MeasurementTimeseries></om:result></omso:PointTimeSeriesObservation></wfs:member>')
+
+
+def sample_responses() -> List[bytes]:
+    start = datetime(2026, 3, 29, 0, 0, tzinfo=timezone.utc)  # spans the DST change in Finland
+    minutes = [start + timedelta(minutes=10 * i) for i in range(30)]
+    z = [wdf.iso_z(t) for t in minutes]
+    docs = [
+        [],
+        [("101418", "t2m", [(z[0], "-3.4")])],
+        [("101418", "t2m", [(t, f"{i * 0.1 - 1:.1f}") for i, t in enumerate(z)])],
+        # NaN, missing and unparsable values; non-Z and offset timestamps
+        [("855522", "GLOB_1MIN", [(z[0], "412.7"), (z[1], "NaN"), (z[2], None), (z[3], "n/a"),
+                                  (z[4].replace("Z", "+00:00"), "0.0"),
+                                  ((minutes[5] + timedelta(hours=3)).strftime("%Y-%m-%dT%H:%M:%S+03:00"), "1e-7"),
+                                  ("garbage", "5")])],
+        # several stations and parameters, interleaved, with repeated instants
+        [(f, p, [(t, f"{k + j:.2f}") for j, t in enumerate(z[k:k + 8])])
+         for k, (f, p) in enumerate([("101418", "t2m"), ("855522", "t2m"), ("101418", "GLOB_1MIN"),
+                                     ("101367", "TotalCloudCover"), ("855522", "GLOB_1MIN")])],
+        [("", "Temperature", [(t, str(i % 7 - 2)) for i, t in enumerate(z)]),
+         ("", "RadiationGlobal", [(t, "NaN" if i % 5 == 0 else str(i * 12.5)) for i, t in enumerate(z)])],
+    ]
+    return [(_HEAD + "".join(tvp_member(*m) for m in doc) + "</wfs:FeatureCollection>").encode() for doc in docs]
+
+
+def rows_key(rows: List[Dict[str, Any]]) -> List[tuple]:
+    """Comparable form of parsed rows (NaN != NaN, so values go through repr)."""
+    return [(r["param"], r["time"], repr(r["value"]), r.get("fmisid")) for r in rows]
+
+
+def series_rows(series, with_station: bool) -> List[Dict[str, Any]]:
+    rows = []
+    for i in range(len(series)):
+        row = series.row(i)
+        if with_station:
+            row["fmisid"] = series.stations[series.station_idx[i]]
+        rows.append(row)
+    return rows
+
+
+def sample_messages():
+    """(topic, message, layout) for every builder, as publish_json() renders them
+    (forecasts without a layout)."""
+    t = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    times = [t + timedelta(hours=h) for h in range(36)]
+    for i in range(6):
+        fb = "Juva Partala" if i % 2 else None
+        loc = 'Mikkeli ä "q" \\ ø' if i % 3 == 0 else "Mikkeli"
+        temp = {"time": t, "value": 3.5 + i} if i != 3 else None
+        irr = {"time": t - timedelta(minutes=i), "value": float("nan") if i == 2 else 1e-7 * i}
+        yield ("a/t", wdf.build_temp_measurement_msg("a/t", loc, temp, fb),
+               wdf.measurement_layout("temperature", loc, fb))
+        yield ("a/i", wdf.build_irr_measurement_msg("a/i", loc, irr),
+               wdf.measurement_layout("irradiance", loc, None))
+        series = {"temperature": ("Cel", temp, "Mikkeli airport AWOS", fb),
+                  "irradiance": ("W/m2", irr if i != 4 else None, "Juva Partala", None)}
+        yield ("a/c", wdf.build_combined_measurement_msg("a/c", loc, series),
+               wdf.combined_measurement_layout(loc, series))
+        values = [None if h == i else (float("nan") if h == 2 * i else round(h * 0.1 - 1, 1))
+                  for h in range(36 - i)]
+        yield ("a/f", wdf.build_forecast_msg("Temperature", "Cel", "a/f", loc, times[:36 - i], values),
+               None)
+        yield ("a/f0", wdf.build_forecast_msg("Irradiance", "W/m2", "a/f0", loc, [], []),
+               None)
+        yield ("a/d", wdf.build_forecast_delta_msg("Temperature", "Cel", "a/d", loc, f"kf-{i}", times if i else [],
+                                                   {times[j]: (None if j == 1 else j * 1.5) for j in range(i)}),
+               None)
+
+
+# --- Checks -------------------------------------------------------------------
+
+def check_templates() -> List[str]:
+    wdf.json_backend = "json"  # templates are only used with the stdlib backend
+    failures, n = [], 0
+    for topic, msg, layout in sample_messages():
+        expected = json.dumps({**msg, "Topic": topic}, ensure_ascii=False).encode("utf-8")
+        got = wdf.render_json(topic, msg, layout)
+        n += 1
+        if got != expected:
+            failures.append(f"render_json {topic}:\n    got      {got[:200]!r}\n    expected {expected[:200]!r}")
+    print(f"render_json vs json.dumps: {n} messages, {len(failures)} mismatches")
+    return failures
+
+
+def check_parser() -> List[str]:
+    failures, n = [], 0
+    for k, xml in enumerate(sample_responses()):
+        for with_station in (False, True):
+            ref = ref_parse_timevaluepairs(xml, with_station)
+            n += 1
+            if rows_key(wdf.parse_timevaluepairs(xml, with_station)) != rows_key(ref):
+                failures.append(f"parse_timevaluepairs, response {k}, with_station={with_station}")
+            # Series keeps whole seconds, which is all FMI sends
+            series = wdf.parse_timevaluepairs_columnar(xml, with_station=with_station)
+            if rows_key(series_rows(series, with_station)) != rows_key(ref):
+                failures.append(f"parse_timevaluepairs_columnar, response {k}, with_station={with_station}")
+            for param in {r["param"] for r in ref} | {"missing"}:
+                ref_latest = ref_latest_value(ref, param)
+                latest = wdf.latest_value(series, param)
+                if ref_latest is not None:
+                    ref_latest = {k: v for k, v in ref_latest.items() if k != "fmisid"}
+                if (latest and rows_key([latest])) != (ref_latest and rows_key([ref_latest])):
+                    failures.append(f"latest_value {param}, response {k}")
+                ref_hourly = ref_bucket_hourly(ref, param)
+                hourly = wdf.bucket_hourly(series, param)
+                if {t: repr(v) for t, v in hourly.items()} != {t: repr(v) for t, v in ref_hourly.items()}:
+                    failures.append(f"bucket_hourly {param}, response {k}")
+    print(f"streaming parser vs ElementTree findall: {n} parses, {len(failures)} mismatches")
+    return failures
+
+
+def main():
+    failures = check_templates() + check_parser()
+    for f in failures:
+        print("  MISMATCH " + f)
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
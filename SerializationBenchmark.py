@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+SerializationBenchmark.py — compare the JSON backends of WeatherDataFetcher.py.
+
+Builds one tick's worth of measurement messages (temperature + irradiance per
+site) and forecast messages (temperature + irradiance per site, 36 hours) with
+the real builders, then times each available backend on them (stdlib json also
+as published, "json+tpl": measurements rendered from precompiled
+MessageTemplates, forecasts serialized whole), plus the binary
+encodings (cbor2 / msgpack, if installed) for payload size. Also times the
+builders themselves with and without the iso_z cache.
+
+Usage:
+  python SerializationBenchmark.py                 # 200 sites, 20 rounds
+  python SerializationBenchmark.py --sites 500 --rounds 50
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+import WeatherDataFetcher as wdf
+
+
+def build_tick(sites: int, hours: int):
+    """(message, template layout) pairs of measurements and forecasts for
+    `sites` sites, as published (forecasts have no layout)."""
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    start = now.replace(minute=0) + timedelta(hours=1)
+    times = [start + timedelta(hours=h) for h in range(hours)]
+    meas, fc = [], []
+    for i in range(sites):
+        loc = f"Site {i} Mikkelinkatu"
+        t = {"time": now - timedelta(minutes=i % 10), "value": -3.4 + i * 0.01}
+        g = {"time": now, "value": 412.7 + i}
+        meas.append((wdf.build_temp_measurement_msg(f"A-T/Measurement/Temperature/site{i}", loc, t,
+                                                    "Mikkeli airport AWOS"),
+                     wdf.measurement_layout("temperature", loc, "Mikkeli airport AWOS")))
+        meas.append((wdf.build_irr_measurement_msg(f"A-T/Measurement/Irradiance/site{i}", loc, g),
+                     wdf.measurement_layout("irradiance", loc, None)))
+        fc.append((wdf.build_forecast_msg("Temperature", "Cel", f"A-T/Forecast/Temperature/site{i}",
+                                          loc, times, [round(-5 + 0.37 * h, 1) for h in range(hours)]),
+                   None))
+        fc.append((wdf.build_forecast_msg("Irradiance", "W/m2", f"A-T/Forecast/Irradiance/site{i}",
+                                          loc, times, [max(0.0, 12.5 * (h % 24 - 6)) for h in range(hours)]),
+                   None))
+    for msg, _ in meas + fc:
+        msg["Topic"] = msg["topic"]  # as publish_json() adds it
+    return meas, fc
+
+
+def template_encoder():
+    """(message, layout) -> bytes through MessageTemplates, as render_json() does."""
+    templates = {}
+
+    def render(msg, layout):
+        if layout is None:
+            return wdf.SERIALIZERS["json"](msg)
+        key, slots = layout
+        tpl = templates.get((msg["topic"], key))
+        if tpl is None:
+            tpl = templates[(msg["topic"], key)] = wdf.MessageTemplate(msg, slots)
+        return tpl.render(msg)
+    return render
+
+
+def time_it(fn, rounds: int) -> float:
+    """Best-of-rounds wall time of fn() in seconds."""
+    best = float("inf")
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sites", type=int, default=200)
+    ap.add_argument("--hours", type=int, default=36)
+    ap.add_argument("--rounds", type=int, default=20)
+    args = ap.parse_args()
+
+    meas, fc = build_tick(args.sites, args.hours)
+    whole = {name: fn for name, fn in wdf.SERIALIZERS.items() if name == "json" or wdf.orjson is not None}
+    whole.update({name: enc[0] for name, enc in wdf.BINARY_ENCODERS.items() if enc[1] is not None})
+    encoders = {}
+    for name, fn in whole.items():
+        encoders[name] = (lambda fn: lambda msg, _layout: fn(msg))(fn)
+        if name == "json":
+            encoders["json+tpl"] = template_encoder()
+    print(f"{args.sites} sites: {len(meas)} measurement + {len(fc)} forecast messages, "
+          f"best of {args.rounds} rounds (x = speed-up over stdlib json)")
+    if wdf.orjson is None:
+        print("orjson not installed, the stdlib JSON backend is the only JSON one measured")
+
+    base = {}
+    for kind, msgs in (("measurement", meas), ("forecast", fc)):
+        for name, dumps in encoders.items():
+            elapsed = time_it(lambda: [dumps(m, layout) for m, layout in msgs], args.rounds)
+            size = sum(len(dumps(m, layout)) for m, layout in msgs)
+            base.setdefault(kind, elapsed)
+            print(f"  {kind:<11} {name:<10} {elapsed * 1e3:8.2f} ms/tick  "
+                  f"{elapsed / len(msgs) * 1e6:6.1f} us/msg  {size / len(msgs):7.0f} B/msg  "
+                  f"x{base[kind] / elapsed:.1f}")
+
+    # Builders: the timestamp formatting is most of their cost
+    cached = time_it(lambda: build_tick(args.sites, args.hours), args.rounds)
+    iso_z = wdf.iso_z
+    wdf.iso_z = iso_z.__wrapped__
+    try:
+        uncached = time_it(lambda: build_tick(args.sites, args.hours), args.rounds)
+    finally:
+        wdf.iso_z = iso_z
+    print(f"  builders    iso_z uncached {uncached * 1e3:.2f} ms/tick, cached {cached * 1e3:.2f} ms/tick")
+
+
+if __name__ == "__main__":
+    main()
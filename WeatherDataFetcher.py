@@ -16,6 +16,8 @@ Run continuously (default topics + MQTT settings from USER CONFIG):
   python WeatherDataFetcher.py --place "Helsinki"
   # or with coordinates:
   python WeatherDataFetcher.py --lat 60.1699 --lon 24.9384
+  # or several forecast locations in one request (per-location topics):
+  python WeatherDataFetcher.py --fc-location "Hirvensalmi|Hirvensalmi" --fc-location "Mikkeli|61.69,27.27"
 """
 
 # =========================== USER CONFIG ======================================
@@ -28,20 +30,70 @@ MQTT_PASSWORD = None          # or "pass"
 MQTT_TLS      = False         # True to enable TLS (uses default CA)
 MQTT_CLIENT_ID = "fmi-forecaster-1"
 MQTT_KEEPALIVE = 60
+MQTT_PROTOCOL  = "3.1.1"      # "3.1.1" or "5" (topic aliases, message expiry, content type, user properties)
 
 # Publish settings
 MQTT_QOS    = 1
 MQTT_RETAIN = False
+MQTT_MAX_INFLIGHT = 20        # QoS>0 messages awaiting PUBACK before paho queues further ones
+MQTT_MAX_QUEUED   = 1000      # paho's in-memory queue bound (0 = unbounded); overflow goes to the outbox
+MQTT_FLUSH_TIMEOUT = 10.0     # seconds to wait for outstanding PUBACKs on shutdown
+MQTT_CONNECT_WAIT = 10.0      # --once: seconds to wait for the broker before publishing (QoS 0 needs a connection)
+
+# MQTT v5 only
+MQTT_TOPIC_ALIASES = True     # send each topic once per connection, then only its 2-byte alias
+MQTT_MEAS_EXPIRY_SEC = 120    # broker discards undelivered measurements after this (0 = never)
+MQTT_FC_EXPIRY_SEC = 7200     # same for forecasts (also clears a stale retained forecast; delta-mode
+                              # keyframes get at least FC_KEYFRAME_HOURS + 1 h, as deltas refer to them)
+MQTT_USER_PROPERTIES: dict = {}  # static metadata on every message, e.g. {"source": "fmi"}
+MQTT_META_PROPERTIES = False  # also send kind/location as user properties (costs ~35 bytes/message)
 
 # Optional: also print full JSON payloads to terminal for debugging
 PRINT_JSON_TO_STDOUT = False
 
+# JSON encoder: "json" (stdlib), "orjson" or "auto" (orjson when installed).
+# orjson is faster but changes the wire bytes: compact separators, NaN -> null
+JSON_BACKEND = "json"
+
+# Payload encoding: "json", or compact binary "cbor" / "msgpack" (short keys, epoch
+# timestamps, float32 forecast arrays), published on "<topic>/cbor" / "<topic>/msgpack"
+PAYLOAD_ENCODING = "json"
+
+# Offline outbox: while the broker is unreachable, messages go to a bounded
+# SQLite queue on disk (survives restarts) and drain at a limited rate on reconnect
+OUTBOX_PATH = ""              # e.g. "/data/outbox.sqlite"; empty = disabled
+OUTBOX_MAX_MESSAGES = 10000
+OUTBOX_MAX_AGE_SEC = 24 * 3600
+OUTBOX_DROP_POLICY = "oldest" # "oldest" or "newest": what to drop when full
+OUTBOX_DRAIN_RATE = 20.0      # messages per second when draining
+
+# Delta publishing: skip a measurement message while its observation hasn't changed
+MEAS_DEDUP = False
+MEAS_HEARTBEAT_SEC = 0        # republish an unchanged observation after this many seconds (0 = never)
+
+# Forecast publishing: "full" every hour, "on-change" (skip pure time shifts of
+# an unchanged run) or "delta" (changes against the last retained full snapshot)
+FC_PUBLISH_MODE = "full"
+FC_KEYFRAME_HOURS = 6         # on-change/delta: publish a full snapshot at least this often
+
 # ---- Topics (customize these) ----
 TOPIC_TEMP_MEAS = "A-T/Measurement/Temperature/Mikkeli_lentoasema"
 TOPIC_IRR_MEAS  = "A-T/Measurement/Irradiance/Juva_Partala"
 TOPIC_TEMP_FC   = "A-T/Forecast/Irradiance/Hirvensalmi"
 TOPIC_IRR_FC    = "A-T/Forecast/Temperature/Hirvensalmi"
 
+# Combined measurements: one message per minute with both series (each with its
+# own timestamp/station) on TOPIC_MEAS_COMBINED, instead of one per topic above
+MEAS_COMBINED = False
+TOPIC_MEAS_COMBINED = "A-T/Measurement/Weather/Hirvensalmi"
+
+# ---- Multi-location forecasts (optional) ----
+# When set, one request fetches all locations and each is published on its own
+# topics ({location} = label). Format: "Label|place" or "Label|lat,lon"
+FC_LOCATIONS: list = []
+TOPIC_TEMP_FC_TEMPLATE = "A-T/Forecast/Temperature/{location}"
+TOPIC_IRR_FC_TEMPLATE  = "A-T/Forecast/Irradiance/{location}"
+
 # ---- Measurement station fallbacks (primary first) ----
 # Use FMI "place" names here (human-readable, with spaces)
 # Format: "FMISID|Human name"
@@ -59,6 +111,35 @@ IRR_MEAS_PLACES = [
     "101367|Joutsa Savenaho",
 ]
 
+# ---- FMI HTTP client ----
+HTTP_TIMEOUT    = 30          # seconds per WFS request
+HTTP_POOL_SIZE  = 0           # keep-alive connections kept open to opendata.fmi.fi (0 = sized from OBS_HEDGE / stations)
+HTTP_LOG_TIMING = False       # True to print per-request timing
+
+# ---- Observation fetch strategy ----
+OBS_BATCH = False             # True: query all stations of a fallback chain in one WFS call
+OBS_HEDGE = False             # True: probe fallback stations concurrently instead of one by one
+OBS_HEDGE_DELAY = 2.0         # seconds before the next fallback is started (0 = all at once)
+OBS_CHAIN_DEADLINE = 20.0     # seconds a hedged fallback chain may take per tick
+OBS_INCREMENTAL = True        # only request data newer than the last observation seen
+OBS_LOOKBACK_MIN = 90         # look-back window (minutes) on cold start / after a gap
+OBS_COLD_RETRY_MIN = 5        # OBS_BATCH: re-probe a higher-priority station without data at most this often
+OBS_PARALLEL_CHAINS = True    # fetch the temperature and irradiance chains concurrently
+OBS_ADAPTIVE_POLL = False     # True: skip requests until the next observation can have arrived
+OBS_POLL_SLACK = 30           # seconds to poll before the learned cadence + ingestion lag is due
+
+# ---- Engine ----
+MEAS_MAX_CATCHUP = 5          # overdue minute ticks run late (back to back) before older ones are skipped
+SCHED_REPORT_EVERY = 60       # print scheduler metrics every N runs of a job (0 = only at shutdown)
+PREFETCH = False              # True: start measurement fetches early and publish on the minute boundary
+PREFETCH_INITIAL_LEAD = 5.0   # seconds of lead before any fetch durations were observed
+PREFETCH_MAX_LEAD = 30.0      # upper bound for the learned lead (seconds)
+PREFETCH_MARGIN = 0.5         # seconds added on top of the observed p95 fetch duration
+
+# ---- Forecast caching ----
+FC_CACHE = True               # reuse the downloaded model run until FMI publishes a newer one
+FC_CACHE_SPARE_HOURS = 12     # extra hours fetched so later hourly jobs can re-slice the same run
+
 # --- ENV OVERRIDES (add after USER CONFIG constants) ---
 import os
 
@@ -70,11 +151,44 @@ MQTT_TLS      = os.getenv("MQTT_TLS", "false").lower() in ("1","true","yes")
 
 MQTT_QOS      = int(os.getenv("MQTT_QOS", MQTT_QOS))
 MQTT_RETAIN   = os.getenv("MQTT_RETAIN", str(MQTT_RETAIN)).lower() in ("1","true","yes")
+MQTT_MAX_INFLIGHT = int(os.getenv("MQTT_MAX_INFLIGHT", MQTT_MAX_INFLIGHT))
+MQTT_MAX_QUEUED = int(os.getenv("MQTT_MAX_QUEUED", MQTT_MAX_QUEUED))
+MQTT_FLUSH_TIMEOUT = float(os.getenv("MQTT_FLUSH_TIMEOUT", MQTT_FLUSH_TIMEOUT))
+MQTT_CONNECT_WAIT = float(os.getenv("MQTT_CONNECT_WAIT", MQTT_CONNECT_WAIT))
+MQTT_PROTOCOL = os.getenv("MQTT_PROTOCOL", MQTT_PROTOCOL).strip()
+MQTT_TOPIC_ALIASES = os.getenv("MQTT_TOPIC_ALIASES", str(MQTT_TOPIC_ALIASES)).lower() in ("1","true","yes")
+MQTT_MEAS_EXPIRY_SEC = int(os.getenv("MQTT_MEAS_EXPIRY_SEC", MQTT_MEAS_EXPIRY_SEC))
+MQTT_FC_EXPIRY_SEC = int(os.getenv("MQTT_FC_EXPIRY_SEC", MQTT_FC_EXPIRY_SEC))
+# "key=value,key=value"
+_env_user_props = os.getenv("MQTT_USER_PROPERTIES", "").strip()
+if _env_user_props:
+    MQTT_USER_PROPERTIES = dict(p.strip().split("=", 1) for p in _env_user_props.split(",") if "=" in p)
+MQTT_META_PROPERTIES = os.getenv("MQTT_META_PROPERTIES", str(MQTT_META_PROPERTIES)).lower() in ("1","true","yes")
+JSON_BACKEND  = os.getenv("JSON_BACKEND", JSON_BACKEND).strip().lower()
+PAYLOAD_ENCODING = os.getenv("PAYLOAD_ENCODING", PAYLOAD_ENCODING).strip().lower()
+OUTBOX_PATH   = os.getenv("OUTBOX_PATH", OUTBOX_PATH)
+OUTBOX_MAX_MESSAGES = int(os.getenv("OUTBOX_MAX_MESSAGES", OUTBOX_MAX_MESSAGES))
+OUTBOX_MAX_AGE_SEC = int(os.getenv("OUTBOX_MAX_AGE_SEC", OUTBOX_MAX_AGE_SEC))
+OUTBOX_DROP_POLICY = os.getenv("OUTBOX_DROP_POLICY", OUTBOX_DROP_POLICY).strip().lower()
+OUTBOX_DRAIN_RATE = float(os.getenv("OUTBOX_DRAIN_RATE", OUTBOX_DRAIN_RATE))
+MEAS_DEDUP    = os.getenv("MEAS_DEDUP", str(MEAS_DEDUP)).lower() in ("1","true","yes")
+MEAS_HEARTBEAT_SEC = int(os.getenv("MEAS_HEARTBEAT_SEC", MEAS_HEARTBEAT_SEC))
+FC_PUBLISH_MODE = os.getenv("FC_PUBLISH_MODE", FC_PUBLISH_MODE).strip().lower()
+FC_KEYFRAME_HOURS = int(os.getenv("FC_KEYFRAME_HOURS", FC_KEYFRAME_HOURS))
 
 TOPIC_TEMP_MEAS = os.getenv("TOPIC_TEMP_MEAS", TOPIC_TEMP_MEAS)
 TOPIC_IRR_MEAS  = os.getenv("TOPIC_IRR_MEAS", TOPIC_IRR_MEAS)
 TOPIC_TEMP_FC   = os.getenv("TOPIC_TEMP_FC", TOPIC_TEMP_FC)
 TOPIC_IRR_FC    = os.getenv("TOPIC_IRR_FC", TOPIC_IRR_FC)
+MEAS_COMBINED   = os.getenv("MEAS_COMBINED", str(MEAS_COMBINED)).lower() in ("1","true","yes")
+TOPIC_MEAS_COMBINED = os.getenv("TOPIC_MEAS_COMBINED", TOPIC_MEAS_COMBINED)
+TOPIC_TEMP_FC_TEMPLATE = os.getenv("TOPIC_TEMP_FC_TEMPLATE", TOPIC_TEMP_FC_TEMPLATE)
+TOPIC_IRR_FC_TEMPLATE  = os.getenv("TOPIC_IRR_FC_TEMPLATE", TOPIC_IRR_FC_TEMPLATE)
+
+# ';'-separated, since lat,lon entries contain commas
+_env_fc_locations = os.getenv("FC_LOCATIONS", "").strip()
+if _env_fc_locations:
+    FC_LOCATIONS = [p.strip() for p in _env_fc_locations.split(";") if p.strip()]
 
 _env_temp_places = os.getenv("TEMP_MEAS_PLACES", "").strip()
 if _env_temp_places:
@@ -84,22 +198,62 @@ _env_irr_places = os.getenv("IRR_MEAS_PLACES", "").strip()
 if _env_irr_places:
     IRR_MEAS_PLACES = [p.strip() for p in _env_irr_places.split(",") if p.strip()]
 
+HTTP_TIMEOUT    = float(os.getenv("HTTP_TIMEOUT", HTTP_TIMEOUT))
+HTTP_POOL_SIZE  = int(os.getenv("HTTP_POOL_SIZE", HTTP_POOL_SIZE))
+HTTP_LOG_TIMING = os.getenv("HTTP_LOG_TIMING", str(HTTP_LOG_TIMING)).lower() in ("1","true","yes")
+OBS_BATCH       = os.getenv("OBS_BATCH", str(OBS_BATCH)).lower() in ("1","true","yes")
+OBS_HEDGE       = os.getenv("OBS_HEDGE", str(OBS_HEDGE)).lower() in ("1","true","yes")
+OBS_HEDGE_DELAY = float(os.getenv("OBS_HEDGE_DELAY", OBS_HEDGE_DELAY))
+OBS_CHAIN_DEADLINE = float(os.getenv("OBS_CHAIN_DEADLINE", OBS_CHAIN_DEADLINE))
+OBS_INCREMENTAL = os.getenv("OBS_INCREMENTAL", str(OBS_INCREMENTAL)).lower() in ("1","true","yes")
+OBS_LOOKBACK_MIN = int(os.getenv("OBS_LOOKBACK_MIN", OBS_LOOKBACK_MIN))
+OBS_COLD_RETRY_MIN = int(os.getenv("OBS_COLD_RETRY_MIN", OBS_COLD_RETRY_MIN))
+OBS_PARALLEL_CHAINS = os.getenv("OBS_PARALLEL_CHAINS", str(OBS_PARALLEL_CHAINS)).lower() in ("1","true","yes")
+OBS_ADAPTIVE_POLL = os.getenv("OBS_ADAPTIVE_POLL", str(OBS_ADAPTIVE_POLL)).lower() in ("1","true","yes")
+OBS_POLL_SLACK  = int(os.getenv("OBS_POLL_SLACK", OBS_POLL_SLACK))
+FC_CACHE        = os.getenv("FC_CACHE", str(FC_CACHE)).lower() in ("1","true","yes")
+MEAS_MAX_CATCHUP = int(os.getenv("MEAS_MAX_CATCHUP", MEAS_MAX_CATCHUP))
+SCHED_REPORT_EVERY = int(os.getenv("SCHED_REPORT_EVERY", SCHED_REPORT_EVERY))
+PREFETCH        = os.getenv("PREFETCH", str(PREFETCH)).lower() in ("1","true","yes")
+PREFETCH_INITIAL_LEAD = float(os.getenv("PREFETCH_INITIAL_LEAD", PREFETCH_INITIAL_LEAD))
+PREFETCH_MAX_LEAD = float(os.getenv("PREFETCH_MAX_LEAD", PREFETCH_MAX_LEAD))
+PREFETCH_MARGIN = float(os.getenv("PREFETCH_MARGIN", PREFETCH_MARGIN))
+FC_CACHE_SPARE_HOURS = int(os.getenv("FC_CACHE_SPARE_HOURS", FC_CACHE_SPARE_HOURS))
+
+if HTTP_POOL_SIZE <= 0:
+    # Hedged chains can have every station of both chains in flight at once
+    # (abandoned requests finish in the background), next to the forecast job
+    chains = len(TEMP_MEAS_PLACES) + len(IRR_MEAS_PLACES) if OBS_HEDGE else 1 + OBS_PARALLEL_CHAINS
+    HTTP_POOL_SIZE = max(4, chains + 1)
+
 # ==============================================================================
 import argparse
+import io
 import json
+import math
+import signal
+import sqlite3
+import struct
 import sys
 import time
 import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Any, Optional
+from functools import lru_cache
+from typing import List, Dict, Any, Iterator, Optional
 from urllib.parse import urlparse, parse_qs
 
 import requests
+from requests.adapters import HTTPAdapter
 import xml.etree.ElementTree as ET
+from array import array
 
 # MQTT lib
 try:
     import paho.mqtt.client as mqtt
+    from paho.mqtt.packettypes import PacketTypes
+    from paho.mqtt.properties import Properties
 except ImportError:
     sys.stderr.write("paho-mqtt is required. Install with: pip install paho-mqtt\n")
     sys.exit(1)
@@ -129,60 +283,290 @@ PARAM_GLOB_FC = "RadiationGlobal"   # W/m2 (forecast, hourly)
 
 # --- Small helpers ------------------------------------------------------------
 
+# Formatted timestamps kept around: forecast hours repeat in every hourly message
+# (35 of 36 overlap) and unchanged observations repeat every minute.
+ISO_Z_CACHE_SIZE = 1024
+
+@lru_cache(maxsize=ISO_Z_CACHE_SIZE)
 def iso_z(dt: datetime, timespec: str = "seconds") -> str:
-    """UTC ISO-8601 string with trailing Z."""
+    """UTC ISO-8601 string with trailing Z (cached)."""
     return dt.astimezone(timezone.utc).isoformat(timespec=timespec).replace("+00:00", "Z")
 
-def ceil_to_minute(dt: datetime) -> datetime:
-    base = dt.replace(second=0, microsecond=0)
-    return base if dt == base else base + timedelta(minutes=1)
-
 def ceil_to_hour(dt: datetime) -> datetime:
     base = dt.replace(minute=0, second=0, microsecond=0)
     return base if dt == base else base + timedelta(hours=1)
 
+# One pooled keep-alive session for all WFS calls (avoids a TCP+TLS handshake per request)
+_http_session: Optional[requests.Session] = None
+_http_lock = threading.Lock()
+
+def get_http_session() -> requests.Session:
+    global _http_session
+    with _http_lock:
+        if _http_session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            s.headers.update({
+                "Accept-Encoding": "gzip, deflate",
+                "Connection": "keep-alive",
+                "User-Agent": "WeatherDataFetcher/1.0",
+            })
+            _http_session = s
+        return _http_session
+
+def close_http_session():
+    global _http_session
+    with _http_lock:
+        if _http_session is not None:
+            _http_session.close()
+            _http_session = None
+
 def wfs_get(storedquery_id: str, **params) -> bytes:
     q = {"service": "WFS", "version": "2.0.0", "request": "getFeature", "storedquery_id": storedquery_id}
     q.update(params)
-    r = requests.get(WFS, params=q, timeout=30)
+    t0 = time.monotonic()
+    r = get_http_session().get(WFS, params=q, timeout=HTTP_TIMEOUT)
+    elapsed_ms = (time.monotonic() - t0) * 1000.0
+    if HTTP_LOG_TIMING:
+        enc = r.headers.get("Content-Encoding", "identity")
+        print(f"[FMI] {storedquery_id} -> {r.status_code} in {elapsed_ms:.0f} ms "
+              f"({len(r.content)} bytes, {enc})")
     r.raise_for_status()
     return r.content
 
-def parse_timevaluepairs(xml_bytes: bytes) -> List[Dict[str, Any]]:
-    """Return list of dicts: param, time (UTC), value (float)"""
-    root = ET.fromstring(xml_bytes)
-    out: List[Dict[str, Any]] = []
-    for member in root.findall(".//wfs:member", NS):
-        prop = member.find(".//om:observedProperty", NS)
-        href = prop.get("{%s}href" % NS["xlink"]) if prop is not None else ""
-        param_code = ""
-        if href:
-            try:
-                param_code = parse_qs(urlparse(href).query).get("param", [""])[0]
-            except Exception:
-                pass
-        for tvp in member.findall(".//wml2:MeasurementTVP", NS):
-            t_el = tvp.find("wml2:time", NS)
-            v_el = tvp.find("wml2:value", NS)
+FMISID_CODESPACE = "http://xml.fmi.fi/namespace/stationcode/fmisid"
+LOCNAME_CODESPACE = "http://xml.fmi.fi/namespace/locationcode/name"
+
+_TAG_MEMBER = "{%s}member" % NS["wfs"]
+_TAG_OBS_PROP = "{%s}observedProperty" % NS["om"]
+_TAG_IDENT = "{%s}identifier" % NS["gml"]
+_TAG_TVP = "{%s}MeasurementTVP" % NS["wml2"]
+_TAG_TIME = "{%s}time" % NS["wml2"]
+_TAG_VALUE = "{%s}value" % NS["wml2"]
+_ATTR_HREF = "{%s}href" % NS["xlink"]
+_TAG_RESULT_TIME = "{%s}resultTime" % NS["om"]
+_TAG_TIME_POS = "{%s}timePosition" % NS["gml"]
+_TAG_NAME = "{%s}name" % NS["gml"]
+_TAG_POS = "{%s}pos" % NS["gml"]
+
+def _param_from_href(href: Optional[str]) -> str:
+    if href:
+        try:
+            return parse_qs(urlparse(href).query).get("param", [""])[0]
+        except Exception:
+            pass
+    return ""
+
+def _iter_tvp_raw(xml_bytes: bytes, with_station: bool = False,
+                  with_site: bool = False) -> Iterator[tuple]:
+    """Streaming parser: yield (param, fmisid, time_text, value_text) as each
+    wml2:MeasurementTVP closes. With with_site the second field is the member's
+    location instead, as 'name|lat lon' (used to split multi-location forecasts).
+
+    Uses iterparse and clears every processed point and member, so memory stays
+    flat for long windows / multi-station responses. O&M puts observedProperty
+    and featureOfInterest before result, so param/fmisid are known by then.
+    """
+    depth = 0  # > 0 while inside a wfs:member
+    param_code = ""
+    fmisid = ""
+    site_name = ""
+    site_pos = ""
+    have_param = False
+    root = None
+    for event, el in ET.iterparse(io.BytesIO(xml_bytes), events=("start", "end")):
+        tag = el.tag
+        if event == "start":
+            if root is None:
+                root = el
+            if tag == _TAG_MEMBER:
+                if depth == 0:
+                    param_code, fmisid, have_param = "", "", False
+                    site_name, site_pos = "", ""
+                depth += 1
+            continue
+        if depth == 0:
+            continue
+        if tag == _TAG_TVP:
+            t_el = el.find(_TAG_TIME)
+            v_el = el.find(_TAG_VALUE)
+            el.clear()
             if t_el is None or v_el is None or v_el.text is None:
                 continue
-            try:
-                t = datetime.fromisoformat(t_el.text.replace("Z", "+00:00")).astimezone(timezone.utc)
-                v = float(v_el.text)
-            except Exception:
-                continue
-            out.append({"param": param_code, "time": t, "value": v})
+            if with_site:
+                yield param_code, f"{site_name}|{site_pos}", t_el.text, v_el.text
+            else:
+                yield param_code, fmisid, t_el.text, v_el.text
+        elif tag == _TAG_OBS_PROP and not have_param:
+            param_code = _param_from_href(el.get(_ATTR_HREF))
+            have_param = True
+        elif tag == _TAG_IDENT and with_station and not fmisid:
+            if el.get("codeSpace") == FMISID_CODESPACE and el.text:
+                fmisid = el.text.strip()
+        elif tag == _TAG_NAME and with_site and not site_name:
+            if el.get("codeSpace") == LOCNAME_CODESPACE and el.text:
+                site_name = el.text.strip()
+        elif tag == _TAG_POS and with_site and not site_pos:
+            site_pos = " ".join((el.text or "").split())
+        elif tag == _TAG_MEMBER:
+            depth -= 1
+            if depth == 0:
+                el.clear()
+                root.clear()  # drop references to finished members
+
+# Distinct wml2:time strings kept parsed. FMI always sends 'YYYY-MM-DDTHH:MM:SSZ'
+# and the same instants repeat across stations, parameters and overlapping windows.
+FMI_TIME_CACHE_SIZE = 4096
+
+def _is_fmi_time(text: str) -> bool:
+    return len(text) == 20 and text[19] == "Z" and text[10] == "T"
+
+def _parse_iso_utc(text: str) -> datetime:
+    return datetime.fromisoformat(text.replace("Z", "+00:00")).astimezone(timezone.utc)
+
+@lru_cache(maxsize=FMI_TIME_CACHE_SIZE)
+def _fmi_time_cached(text: str) -> datetime:
+    return _parse_iso_utc(text)
+
+@lru_cache(maxsize=FMI_TIME_CACHE_SIZE)
+def _fmi_epoch_cached(text: str) -> int:
+    return int(_fmi_time_cached(text).timestamp())
+
+def fmi_time(text: str) -> datetime:
+    """Parse a wml2:time to an aware UTC datetime (cached for FMI's fixed format)."""
+    if _is_fmi_time(text):
+        return _fmi_time_cached(text)
+    return _parse_iso_utc(text)
+
+def fmi_time_epoch(text: str) -> int:
+    """Parse a wml2:time to epoch seconds (cached for FMI's fixed format)."""
+    if _is_fmi_time(text):
+        return _fmi_epoch_cached(text)
+    return int(_parse_iso_utc(text).timestamp())
+
+def iter_timevaluepairs(xml_bytes: bytes, with_station: bool = False) -> Iterator[Dict[str, Any]]:
+    """Yield dicts: param, time (UTC), value (float) [, fmisid if with_station]"""
+    for param_code, fmisid, t_text, v_text in _iter_tvp_raw(xml_bytes, with_station):
+        try:
+            t = fmi_time(t_text)
+            v = float(v_text)
+        except Exception:
+            continue
+        row = {"param": param_code, "time": t, "value": v}
+        if with_station:
+            row["fmisid"] = fmisid
+        yield row
+
+def parse_timevaluepairs(xml_bytes: bytes, with_station: bool = False) -> List[Dict[str, Any]]:
+    """Return list of dicts: param, time (UTC), value (float) [, fmisid if with_station]"""
+    return list(iter_timevaluepairs(xml_bytes, with_station))
+
+class Series:
+    """Columnar time series: epoch seconds (int64), values (float64) and
+    interned param / station codes, one entry per point.
+
+    Replaces the per-point dict + datetime of parse_timevaluepairs() on the
+    fetch paths; latest_value() and bucket_hourly() work on it directly.
+    """
+    __slots__ = ("times", "values", "param_idx", "station_idx", "params", "stations", "_codes")
+
+    def __init__(self):
+        self.times = array("q")
+        self.values = array("d")
+        self.param_idx = array("H")
+        self.station_idx = array("H")
+        self.params: List[str] = []
+        self.stations: List[str] = []
+        self._codes: Dict[tuple, int] = {}
+
+    def _intern(self, table: List[str], kind: str, code: str) -> int:
+        idx = self._codes.get((kind, code))
+        if idx is None:
+            idx = self._codes[(kind, code)] = len(table)
+            table.append(code)
+        return idx
+
+    def append(self, param: str, epoch: int, value: float, fmisid: str = ""):
+        self.times.append(epoch)
+        self.values.append(value)
+        self.param_idx.append(self._intern(self.params, "p", param))
+        self.station_idx.append(self._intern(self.stations, "s", fmisid))
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def row(self, i: int) -> Dict[str, Any]:
+        return {
+            "param": self.params[self.param_idx[i]],
+            "time": datetime.fromtimestamp(self.times[i], timezone.utc),
+            "value": self.values[i],
+        }
+
+    def param_times(self, param: str) -> List[int]:
+        """Sorted epoch seconds of all points of param."""
+        if param not in self.params:
+            return []
+        code = self.params.index(param)
+        return sorted(t for p, t in zip(self.param_idx, self.times) if p == code)
+
+    def split_by_station(self) -> Dict[str, "Series"]:
+        out: Dict[str, Series] = {}
+        for i in range(len(self.times)):
+            fmisid = self.stations[self.station_idx[i]]
+            part = out.get(fmisid)
+            if part is None:
+                part = out[fmisid] = Series()
+            part.append(self.params[self.param_idx[i]], self.times[i], self.values[i], fmisid)
+        return out
+
+def parse_timevaluepairs_columnar(xml_bytes: bytes, with_station: bool = False,
+                                  with_site: bool = False) -> Series:
+    """Like parse_timevaluepairs() but returns a columnar Series.
+
+    with_site tags points with their 'name|lat lon' location instead of fmisid.
+    """
+    out = Series()
+    for param_code, fmisid, t_text, v_text in _iter_tvp_raw(xml_bytes, with_station, with_site):
+        try:
+            epoch = fmi_time_epoch(t_text)
+            v = float(v_text)
+        except Exception:
+            continue
+        out.append(param_code, epoch, v, fmisid)
     return out
 
-def latest_value(series: List[Dict[str, Any]], param: str) -> Optional[Dict[str, Any]]:
+def latest_value(series, param: str) -> Optional[Dict[str, Any]]:
+    """Newest non-NaN row for param, from a Series or a list of row dicts."""
+    if isinstance(series, Series):
+        if param not in series.params:
+            return None
+        code = series.params.index(param)
+        best = -1
+        for i, (p, v) in enumerate(zip(series.param_idx, series.values)):
+            if p == code and v == v and (best < 0 or series.times[i] > series.times[best]):
+                best = i
+        return series.row(best) if best >= 0 else None
     vals = [row for row in series if row["param"] == param and row["value"] == row["value"]]
     if not vals:
         return None
     return max(vals, key=lambda r: r["time"])
 
-def bucket_hourly(series: List[Dict[str, Any]], want_param: str) -> Dict[datetime, float]:
+def bucket_hourly(series, want_param: str) -> Dict[datetime, float]:
     """Map hour -> value for param (keeps last if duplicates)."""
     d: Dict[datetime, float] = {}
+    if isinstance(series, Series):
+        if want_param not in series.params:
+            return d
+        code = series.params.index(want_param)
+        by_epoch: Dict[int, float] = {}
+        for p, t, v in zip(series.param_idx, series.times, series.values):
+            if p == code:
+                by_epoch[t - t % 3600] = v
+        for t, v in by_epoch.items():
+            d[datetime.fromtimestamp(t, timezone.utc)] = v
+        return d
     for r in series:
         if r["param"] == want_param:
             t = r["time"].replace(minute=0, second=0, microsecond=0)
@@ -191,45 +575,392 @@ def bucket_hourly(series: List[Dict[str, Any]], want_param: str) -> Dict[datetim
 
 # --- Data fetchers ------------------------------------------------------------
 
-def fetch_latest_measurements(loc: Dict[str, str]) -> Dict[str, Optional[Dict[str, Any]]]:
-    """Pull recent observations and return the latest for t2m and GLOB_1MIN."""
-    now_utc = datetime.now(timezone.utc)
-    start = (now_utc - timedelta(minutes=90))
-    obs_t_xml = wfs_get(
-        OBS_WEATHER_SQ,
-        parameters=PARAM_T_OBS,
+# Observation parameter -> stored query that serves it
+OBS_QUERIES = {
+    PARAM_T_OBS: OBS_WEATHER_SQ,
+    PARAM_GLOB_OBS: OBS_RADIATION_SQ,
+}
+
+# Per-tick cache: (fmisid or location, param) -> latest row, or the exception raised
+ObsCache = Dict[Any, Any]
+
+def _obs_cache_key(loc: Dict[str, str], param: str):
+    return (loc.get("fmisid") or tuple(sorted(loc.items())), param)
+
+# Newest observation seen per (station, param), kept across ticks for incremental windows
+_obs_last: Dict[Any, Dict[str, Any]] = {}
+# Batched mode: when a station without recent data was last probed
+_obs_cold_probe: Dict[Any, datetime] = {}
+
+def obs_cold_start(now_utc: datetime) -> datetime:
+    return now_utc - timedelta(minutes=OBS_LOOKBACK_MIN)
+
+def obs_window_start(key, now_utc: datetime) -> datetime:
+    """Start of the request window: the last seen observation, or the cold look-back."""
+    cold = obs_cold_start(now_utc)
+    prev = _obs_last.get(key) if OBS_INCREMENTAL else None
+    if prev is None or prev["time"] <= cold:
+        return cold
+    return prev["time"]  # inclusive, so a healthy response always repeats it
+
+# Learned publication pattern per (station, param): cadence (s) and ingestion lag (s)
+_obs_poll: Dict[Any, Dict[str, Any]] = {}
+obs_poll_stats = {"requests": 0, "skipped": 0}
+
+def _learn_poll(key, rows: Series, param: str, prev: Optional[Dict[str, Any]],
+                latest: Optional[Dict[str, Any]], now_utc: datetime):
+    st = _obs_poll.setdefault(key, {"deltas": deque(maxlen=10), "lags": deque(maxlen=10), "polled": None})
+    times = rows.param_times(param)
+    st["deltas"].extend(b - a for a, b in zip(times, times[1:]) if b > a)
+    if prev is not None and latest is not None and latest["time"] > prev["time"]:
+        # A new point appeared since the previous poll; if that poll was recent,
+        # now - obs time is a tight estimate of FMI's ingestion lag
+        if st["polled"] is not None and (now_utc - st["polled"]).total_seconds() <= 90:
+            st["lags"].append((now_utc - latest["time"]).total_seconds())
+    st["polled"] = now_utc
+
+def obs_poll_due(key, now_utc: datetime) -> bool:
+    """False when the next observation for key cannot have been published yet."""
+    if not OBS_ADAPTIVE_POLL:
+        return True
+    st = _obs_poll.get(key)
+    last = _obs_last.get(key)
+    if st is None or last is None or not st["deltas"] or not st["lags"]:
+        return True  # nothing learned yet
+    due = last["time"] + timedelta(seconds=min(st["deltas"]) + min(st["lags"]) - OBS_POLL_SLACK)
+    return now_utc >= due
+
+def last_seen(key, now_utc: datetime) -> Optional[Dict[str, Any]]:
+    """Last observation seen for key, if still within the look-back."""
+    last = _obs_last.get(key)
+    if last is not None and last["time"] < obs_cold_start(now_utc):
+        _obs_last.pop(key, None)
+        return None
+    return last
+
+def remember_latest(key, rows: Series, param: str,
+                    now_utc: datetime) -> Optional[Dict[str, Any]]:
+    """Merge new rows with the last seen observation; return the latest within the look-back."""
+    latest = latest_value(rows, param)
+    prev = _obs_last.get(key)
+    if OBS_ADAPTIVE_POLL:
+        _learn_poll(key, rows, param, prev, latest, now_utc)
+    if prev is not None and (latest is None or prev["time"] > latest["time"]):
+        latest = prev
+    if latest is None or latest["time"] < obs_cold_start(now_utc):
+        _obs_last.pop(key, None)
+        return None
+    _obs_last[key] = latest
+    return latest
+
+def _fetch_obs_rows(param: str, start: datetime, end: datetime,
+                    with_station: bool = False, **loc) -> Series:
+    obs_poll_stats["requests"] += 1
+    xml = wfs_get(
+        OBS_QUERIES[param],
+        parameters=param,
         starttime=iso_z(start),
-        endtime=iso_z(now_utc),
+        endtime=iso_z(end),
         **loc,
     )
-    obs_g_xml = wfs_get(
-        OBS_RADIATION_SQ,
-        parameters=PARAM_GLOB_OBS,
-        starttime=iso_z(start),
-        endtime=iso_z(now_utc),
+    return parse_timevaluepairs_columnar(xml, with_station=with_station)
+
+def fetch_latest_param(loc: Dict[str, str], param: str,
+                       cache: Optional[ObsCache] = None) -> Optional[Dict[str, Any]]:
+    """Pull recent observations of a single parameter and return the latest row.
+
+    With a cache (one dict per tick), each (station, param) is downloaded at most
+    once; failures are cached too so a dead station is not retried in the same tick.
+    With OBS_INCREMENTAL only the window since the last seen observation is
+    requested; an empty answer there means a gap, and the full look-back is re-read.
+    With OBS_ADAPTIVE_POLL no request is made while the next point cannot exist yet
+    (learned cadence + ingestion lag); the last seen observation is returned instead.
+    """
+    key = _obs_cache_key(loc, param)
+    if cache is not None and key in cache:
+        hit = cache[key]
+        if isinstance(hit, Exception):
+            raise hit
+        return hit
+    now_utc = datetime.now(timezone.utc)
+    if not obs_poll_due(key, now_utc):
+        obs_poll_stats["skipped"] += 1
+        latest = last_seen(key, now_utc)
+        if cache is not None:
+            cache[key] = latest
+        return latest
+    start = obs_window_start(key, now_utc)
+    try:
+        rows = _fetch_obs_rows(param, start, now_utc, **loc)
+        if not rows and start > obs_cold_start(now_utc):
+            _obs_last.pop(key, None)
+            rows = _fetch_obs_rows(param, obs_cold_start(now_utc), now_utc, **loc)
+        latest = remember_latest(key, rows, param, now_utc)
+    except requests.RequestException as e:
+        if cache is not None:
+            cache[key] = e
+        raise
+    if cache is not None:
+        cache[key] = latest
+    return latest
+
+def fetch_latest_param_batch(fmisids: List[str], param: str,
+                             cache: Optional[ObsCache] = None) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Pull one parameter for several stations (in priority order) in a single WFS call.
+
+    Returns fmisid -> latest row (None when the station had no data) and fills
+    the per-tick cache for every station requested, so later single-station
+    lookups hit it. Stations without history are only requested while they rank
+    above the best station with history, at most every OBS_COLD_RETRY_MIN minutes.
+    """
+    if cache is not None:
+        keys = [_obs_cache_key({"fmisid": f}, param) for f in fmisids]
+        if all(k in cache and not isinstance(cache[k], Exception) for k in keys):
+            return {f: cache[k] for f, k in zip(fmisids, keys)}
+    now_utc = datetime.now(timezone.utc)
+    keys = {f: _obs_cache_key({"fmisid": f}, param) for f in fmisids}
+    if not any(obs_poll_due(k, now_utc) for k in keys.values()):
+        obs_poll_stats["skipped"] += 1
+        out = {f: last_seen(k, now_utc) for f, k in keys.items()}
+        if cache is not None:
+            for f, latest in out.items():
+                cache[keys[f]] = latest
+        return out
+    cold = obs_cold_start(now_utc)
+    starts = {f: obs_window_start(k, now_utc) for f, k in keys.items()}
+    by_station: Dict[str, Series] = {}
+    out: Dict[str, Optional[Dict[str, Any]]] = {}
+
+    def pull(ids: List[str], start: datetime):
+        # repeated fmisid=... query args
+        by_station.update(_fetch_obs_rows(param, start, now_utc, with_station=True,
+                                          fmisid=list(ids)).split_by_station())
+
+    def cold_due(f: str) -> bool:
+        probed = _obs_cold_probe.get(keys[f])
+        return probed is None or now_utc - probed >= timedelta(minutes=OBS_COLD_RETRY_MIN)
+
+    def settle(ids: List[str]):
+        for f in ids:
+            out[f] = remember_latest(keys[f], by_station.get(f, Series()), param, now_utc)
+            if out[f] is None:
+                _obs_cold_probe[keys[f]] = now_utc
+            else:
+                _obs_cold_probe.pop(keys[f], None)
+
+    # One request: stations with history share the narrowest window covering
+    # them; stations without any (cold) only matter while they outrank the best
+    # station with history, and widen the window to the look-back, so those
+    # are re-probed at most every OBS_COLD_RETRY_MIN minutes
+    warm = [f for f in fmisids if starts[f] > cold]
+    best = fmisids.index(warm[0]) if warm else len(fmisids)
+    probe = [f for f in fmisids[:best] if cold_due(f)]
+    ids = [f for f in fmisids if f in warm or f in probe]
+    if ids:
+        start = cold if probe else min(starts[f] for f in warm)
+        pull(ids, start)
+        gaps = [f for f in warm if not by_station.get(f) and start > cold]
+        if gaps:
+            for f in gaps:
+                _obs_last.pop(keys[f], None)
+            pull(gaps, cold)
+        settle(ids)
+    # The stations with history went quiet: probe the cold ones they outranked
+    best = next((i for i, f in enumerate(fmisids) if out.get(f) is not None), len(fmisids))
+    late = [f for f in fmisids[:best] if f not in out and cold_due(f)]
+    if late:
+        pull(late, cold)
+        settle(late)
+    for f in fmisids:
+        if f not in out:
+            out[f] = last_seen(keys[f], now_utc)  # not requested this tick
+        elif cache is not None:
+            cache[keys[f]] = out[f]
+    return {f: out[f] for f in fmisids}
+
+def split_place(item: str):
+    """'FMISID|Human name' -> (fmisid, name)"""
+    fmisid, name = item.split("|", 1)
+    return fmisid, name
+
+def fetch_from_chain(places: List[str], param: str, label: str,
+                     cache: Optional[ObsCache] = None):
+    """Try stations in priority order until one has a value for param.
+
+    Returns (latest_row, fallback_station_name); the name is None when the
+    primary answered (or nothing did). With OBS_BATCH the whole chain is pulled
+    in one request and the first station with data wins; if that request fails
+    we fall back to probing the stations one by one (or hedged, see OBS_HEDGE).
+    """
+    if OBS_BATCH and len(places or []) > 1:
+        ids = [split_place(item) for item in places]
+        try:
+            got = fetch_latest_param_batch([f for f, _ in ids], param, cache)
+        except requests.RequestException as e:
+            sys.stderr.write(f"[FMI] {label} batched query failed, probing one by one: {e}\n")
+        else:
+            for i, (fmisid, name) in enumerate(ids):
+                if got.get(fmisid) is not None:
+                    return got[fmisid], (name if i != 0 else None)
+            return None, None
+    if OBS_HEDGE and len(places or []) > 1:
+        return fetch_from_chain_hedged(places, param, label, cache)
+    for i, item in enumerate(places or []):
+        fmisid, name = split_place(item)
+        try:
+            latest = fetch_latest_param({"fmisid": fmisid}, param, cache)
+        except requests.RequestException as e:
+            sys.stderr.write(f"[FMI] {label} station failed (fmisid={fmisid}, name={name}): {e}\n")
+            continue
+        if latest is not None:
+            return latest, (name if i != 0 else None)
+    return None, None
+
+def fetch_from_chain_hedged(places: List[str], param: str, label: str,
+                            cache: Optional[ObsCache] = None,
+                            delay: Optional[float] = None, deadline: Optional[float] = None):
+    """Hedged variant of fetch_from_chain().
+
+    Station i+1 is started OBS_HEDGE_DELAY seconds after station i (or as soon
+    as station i fails / has no data). The highest-priority station with data
+    wins once every station ahead of it has resolved. When the chain deadline
+    passes, the best answer so far is used and the remaining requests are
+    abandoned (queued ones are cancelled, in-flight ones finish in the background).
+    """
+    delay = OBS_HEDGE_DELAY if delay is None else delay
+    deadline = OBS_CHAIN_DEADLINE if deadline is None else deadline
+    ids = [split_place(item) for item in places]
+    results: Dict[int, Optional[Dict[str, Any]]] = {}  # index -> row/None once resolved
+    futs: Dict[Any, int] = {}
+    pending = set()
+    t_end = time.monotonic() + deadline
+    next_i = 0
+    next_launch = time.monotonic()
+    pool = ThreadPoolExecutor(max_workers=len(ids), thread_name_prefix=f"fmi-{label.lower()}")
+
+    def pick(final: bool):
+        for i in range(len(ids)):
+            if i not in results:
+                if not final:
+                    return None  # a higher-priority station is still pending
+                continue
+            if results[i] is not None:
+                return results[i], (ids[i][1] if i != 0 else None)
+        return (None, None) if final or len(results) == len(ids) else None
+
+    try:
+        while True:
+            now = time.monotonic()
+            while next_i < len(ids) and now >= next_launch:
+                fut = pool.submit(fetch_latest_param, {"fmisid": ids[next_i][0]}, param, cache)
+                futs[fut] = next_i
+                pending.add(fut)
+                next_i += 1
+                next_launch = now + delay
+            chosen = pick(final=False)
+            if chosen is not None:
+                return chosen
+            if now >= t_end:
+                sys.stderr.write(f"[FMI] {label} chain hit its {deadline:g}s deadline\n")
+                return pick(final=True)
+            wake = t_end if next_i >= len(ids) else min(next_launch, t_end)
+            done, pending = wait(pending, timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+            for fut in done:
+                i = futs[fut]
+                fmisid, name = ids[i]
+                try:
+                    results[i] = fut.result()
+                except requests.RequestException as e:
+                    sys.stderr.write(f"[FMI] {label} station failed (fmisid={fmisid}, name={name}): {e}\n")
+                    results[i] = None
+                if results[i] is None and i == next_i - 1:
+                    next_launch = time.monotonic()  # no answer here: start the next one now
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# Runs the temperature and irradiance chains side by side (OBS_PARALLEL_CHAINS)
+_chain_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="fmi-chain")
+
+def fetch_measurement_chains(cache: Optional[ObsCache] = None):
+    """fetch_from_chain() for the temperature and irradiance chains -> (temp, irr).
+
+    With OBS_PARALLEL_CHAINS both run at once on the pooled HTTP session, so a
+    tick takes as long as the slower chain instead of the sum of both.
+    """
+    cache = {} if cache is None else cache
+    if not OBS_PARALLEL_CHAINS:
+        return (fetch_from_chain(TEMP_MEAS_PLACES, PARAM_T_OBS, "Temp", cache),
+                fetch_from_chain(IRR_MEAS_PLACES, PARAM_GLOB_OBS, "Irr", cache))
+    irr_fut = _chain_pool.submit(fetch_from_chain, IRR_MEAS_PLACES, PARAM_GLOB_OBS, "Irr", cache)
+    try:
+        temp = fetch_from_chain(TEMP_MEAS_PLACES, PARAM_T_OBS, "Temp", cache)
+    finally:
+        irr = irr_fut.result()  # also re-raises its error
+    return temp, irr
+
+def forecast_origin(xml_bytes: bytes) -> Optional[datetime]:
+    """Model run (origin) time of a forecast response: the first om:resultTime."""
+    for _event, el in ET.iterparse(io.BytesIO(xml_bytes), events=("end",)):
+        if el.tag == _TAG_RESULT_TIME:
+            pos = el.find(".//" + _TAG_TIME_POS)
+            if pos is not None and pos.text:
+                try:
+                    return fmi_time(pos.text.strip())
+                except ValueError:
+                    return None
+            return None
+    return None
+
+def probe_forecast_origin(loc: Dict[str, str], at: datetime) -> Optional[datetime]:
+    """Cheap check of the latest model run: one parameter, one time step."""
+    xml = wfs_get(
+        FC_HARMONIE_SQ,
+        parameters=PARAM_T_FC,
+        starttime=iso_z(at),
+        endtime=iso_z(at),
+        timestep=60,
         **loc,
     )
-    obs_t = parse_timevaluepairs(obs_t_xml)
-    obs_g = parse_timevaluepairs(obs_g_xml)
-    return {
-        "t": latest_value(obs_t, PARAM_T_OBS),
-        "g": latest_value(obs_g, PARAM_GLOB_OBS),
-    }
-
-def fetch_hourly_forecast(loc: Dict[str, str], hours: int) -> Dict[str, Any]:
-    """Pull forecast from next full hour for 'hours' hours, return hourly arrays."""
-    now_utc = datetime.now(timezone.utc)
-    start = ceil_to_hour(now_utc)
-    end = start + timedelta(hours=hours)
+    return forecast_origin(xml)
+
+# Location(s) -> last downloaded model run: origin, covered window, parsed Series
+_fc_cache: Dict[Any, Dict[str, Any]] = {}
+
+def _forecast_run(loc: Dict[str, Any], start: datetime, end: datetime, with_site: bool = False):
+    """Return (Series, origin) covering [start, end] for loc (values may be lists).
+
+    With FC_CACHE the run is fetched FC_CACHE_SPARE_HOURS past the horizon and
+    kept; later calls only probe the model origin time and re-slice the cached
+    run while it is unchanged and still covers the window (or when the probe
+    itself fails).
+    """
+    key = (with_site, tuple((k, tuple(v) if isinstance(v, list) else v) for k, v in sorted(loc.items())))
+    cached = _fc_cache.get(key) if FC_CACHE else None
+    if cached is not None and cached["start"] <= start and cached["end"] >= end:
+        try:
+            origin = probe_forecast_origin(loc, start)
+        except requests.RequestException as e:
+            sys.stderr.write(f"[FMI] Forecast freshness check failed ({e}), re-using cached run {iso_z(cached['origin'])}\n")
+            return cached["series"], cached["origin"]
+        if origin is not None and origin == cached["origin"]:
+            print(f"[FMI] Forecast run {iso_z(origin)} unchanged, re-using cached run")
+            return cached["series"], origin
+    fetch_end = end + timedelta(hours=FC_CACHE_SPARE_HOURS) if FC_CACHE else end
     fc_xml = wfs_get(
         FC_HARMONIE_SQ,
         parameters=",".join([PARAM_T_FC, PARAM_GLOB_FC]),
         starttime=iso_z(start),
-        endtime=iso_z(end),
+        endtime=iso_z(fetch_end),
         timestep=60,  # hourly
         **loc,
     )
-    fc = parse_timevaluepairs(fc_xml)
+    fc = parse_timevaluepairs_columnar(fc_xml, with_site=with_site)
+    origin = forecast_origin(fc_xml)
+    if FC_CACHE and origin is not None:
+        _fc_cache[key] = {"origin": origin, "start": start, "end": fetch_end, "series": fc}
+    return fc, origin
+
+def _slice_hourly(fc: Series, start: datetime, hours: int, origin: Optional[datetime]) -> Dict[str, Any]:
     temp_by_hour = bucket_hourly(fc, PARAM_T_FC)
     irr_by_hour = bucket_hourly(fc, PARAM_GLOB_FC)
     hourly_times = [start + timedelta(hours=h) for h in range(hours)]
@@ -238,8 +969,68 @@ def fetch_hourly_forecast(loc: Dict[str, str], hours: int) -> Dict[str, Any]:
         "temp_vals": [temp_by_hour.get(t) for t in hourly_times],
         "irr_vals": [irr_by_hour.get(t) for t in hourly_times],
         "start": start,
+        "origin": origin,
     }
 
+def fetch_hourly_forecast(loc: Dict[str, str], hours: int) -> Dict[str, Any]:
+    """Pull forecast from next full hour for 'hours' hours, return hourly arrays."""
+    now_utc = datetime.now(timezone.utc)
+    start = ceil_to_hour(now_utc)
+    fc, origin = _forecast_run(loc, start, start + timedelta(hours=hours))
+    return _slice_hourly(fc, start, hours, origin)
+
+def _place_name(place: str) -> str:
+    # FMI answers "Espoo,Finland" as "Espoo": only the part before the comma counts
+    return place.split(",", 1)[0].strip().casefold()
+
+def match_site(loc: Dict[str, str], sites: List[str]) -> Optional[str]:
+    """Pick the response site ('name|lat lon') that belongs to a requested location."""
+    if "place" in loc:
+        want = _place_name(loc["place"])
+        for site in sites:
+            if _place_name(site.split("|", 1)[0]) == want:
+                return site
+        return None
+    lat, lon = (float(x) for x in loc["latlon"].split(","))
+    best, best_d = None, None
+    for site in sites:
+        try:
+            s_lat, s_lon = (float(x) for x in site.split("|", 1)[1].split())
+        except ValueError:
+            continue
+        d = (s_lat - lat) ** 2 + (s_lon - lon) ** 2
+        if best_d is None or d < best_d:
+            best, best_d = site, d
+    return best
+
+def fetch_hourly_forecast_multi(locs: List[Dict[str, str]], hours: int) -> List[Dict[str, Any]]:
+    """Like fetch_hourly_forecast() for several locations in one WFS request.
+
+    Places and lat/lons are passed as repeated stored-query arguments; the
+    response is split per location by name (places) or nearest point (latlons).
+    A place whose name FMI answers differently is matched by its position,
+    when the response has one site per requested location.
+    """
+    now_utc = datetime.now(timezone.utc)
+    start = ceil_to_hour(now_utc)
+    params: Dict[str, List[str]] = {}
+    for loc in locs:
+        for k, v in loc.items():
+            params.setdefault(k, []).append(v)
+    fc, origin = _forecast_run(params, start, start + timedelta(hours=hours), with_site=True)
+    parts = fc.split_by_station()
+    sites = list(parts)  # in response order, which follows the request's
+    requested = [(k, v) for k, vs in params.items() for v in vs]
+    out = []
+    for loc in locs:
+        site = match_site(loc, sites)
+        if site is None and len(sites) == len(requested):
+            site = sites[requested.index(next(iter(loc.items())))]
+        if site is None:
+            sys.stderr.write(f"[FMI] No forecast returned for {loc}\n")
+        out.append(_slice_hourly(parts.get(site, Series()), start, hours, origin))
+    return out
+
 # --- Message builders ----------------------------------------------------------
 def build_temp_measurement_msg(topic: str, location_str: str, latest_t: Optional[Dict[str, Any]],
                                fallback_station: Optional[str] = None) -> Dict[str, Any]:
@@ -283,6 +1074,36 @@ def build_irr_measurement_msg(topic: str, location_str: str, latest_g: Optional[
     return msg
 
 
+def build_combined_measurement_msg(topic: str, location_str: str,
+                                   series: Dict[str, tuple]) -> Dict[str, Any]:
+    """One envelope for several measurements.
+
+    series: name -> (unit, latest row or None, primary station, fallback station).
+    Each entry carries its own timestamp and location; the envelope timestamp is
+    the newest observation (or now, if there is none).
+    """
+    now = datetime.now(timezone.utc)
+    msg_id = iso_z(now, "milliseconds")
+    msg: Dict[str, Any] = {"messageid": msg_id, "timestamp": None}
+    newest = None
+    for name, (unit, latest, station, fallback_station) in series.items():
+        entry = {
+            "value": latest["value"] if latest else None,
+            "unit": unit,
+            "timestamp": iso_z(latest["time"], "milliseconds") if latest else None,
+            "location": station,
+        }
+        if fallback_station:
+            entry["fallbackStation"] = fallback_station
+        msg[name] = entry
+        if latest and (newest is None or latest["time"] > newest):
+            newest = latest["time"]
+    msg["timestamp"] = iso_z(newest or now, "milliseconds")
+    msg["topic"] = topic
+    msg["location"] = location_str
+    return msg
+
+
 def build_forecast_msg(series_name: str, unit: str, topic: str, location_str: str,
                        times: List[datetime], values: List[Optional[float]]) -> Dict[str, Any]:
     msg_id = iso_z(datetime.now(timezone.utc), "milliseconds")
@@ -301,12 +1122,616 @@ def build_forecast_msg(series_name: str, unit: str, topic: str, location_str: st
         "location": location_str,
     }
 
+def build_forecast_delta_msg(series_name: str, unit: str, topic: str, location_str: str,
+                             keyframe_id: str, times: List[datetime],
+                             changes: Dict[datetime, Optional[float]]) -> Dict[str, Any]:
+    """Compact forecast: window start/length plus only the values that differ
+    from the keyframe (the last full snapshot, referenced by its messageId)."""
+    msg_id = iso_z(datetime.now(timezone.utc), "milliseconds")
+    return {
+        "messageId": msg_id,
+        "forecastDelta": {
+            "keyframeId": keyframe_id,
+            "start": iso_z(times[0]) if times else None,
+            "hours": len(times),
+            "series": {
+                series_name: {
+                    "UnitOfMeasure": unit,
+                    "changes": {iso_z(t): v for t, v in changes.items()}
+                }
+            }
+        },
+        "topic": topic,
+        "location": location_str,
+    }
+
+# Template layouts for render_json(): (key naming everything the builder writes
+# as a constant, key paths of the fields that change every tick). Measurements
+# only: a forecast is mostly its per-tick arrays, so it is serialized whole.
+
+def measurement_layout(series_name: str, location_str: str,
+                       fallback_station: Optional[str]) -> tuple:
+    slots = [("messageid",), ("timestamp",), (series_name, "value")]
+    if fallback_station:
+        slots.append(("fallbackStation",))
+    return ("measurement", series_name, location_str, bool(fallback_station)), slots
+
+def combined_measurement_layout(location_str: str, series: Dict[str, tuple]) -> tuple:
+    key: List[Any] = ["combined", location_str]
+    slots = [("messageid",), ("timestamp",)]
+    for name, (unit, _latest, station, fallback_station) in series.items():
+        key.append((name, unit, station, bool(fallback_station)))
+        slots += [(name, "value"), (name, "timestamp")]
+        if fallback_station:
+            slots.append((name, "fallbackStation"))
+    return tuple(key), slots
+
+# --- Serialization --------------------------------------------------------------
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _dumps_json(message: Dict[str, Any]) -> bytes:
+    return json.dumps(message, ensure_ascii=False).encode("utf-8")
+
+def _dumps_orjson(message: Dict[str, Any]) -> bytes:
+    # Compact separators and NaN -> null; otherwise the same document as json
+    return orjson.dumps(message)
+
+SERIALIZERS = {"json": _dumps_json, "orjson": _dumps_orjson}
+
+def resolve_json_backend(name: str) -> str:
+    """JSON_BACKEND name -> available SERIALIZERS key ("auto" picks orjson if installed)."""
+    if name == "auto":
+        name = "orjson" if orjson is not None else "json"
+    if name == "orjson" and orjson is None:
+        sys.stderr.write("[MQTT] orjson not installed (pip install orjson), using stdlib json\n")
+        name = "json"
+    if name not in SERIALIZERS:
+        sys.stderr.write(f"[MQTT] Unknown JSON_BACKEND {name!r}, using stdlib json\n")
+        name = "json"
+    return name
+
+json_backend = resolve_json_backend(JSON_BACKEND)
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# RFC 8746 typed-array tag: IEEE 754 binary32, little endian
+CBOR_TAG_FLOAT32_LE = 85
+
+def _epoch_ms(text: Optional[str]) -> Optional[int]:
+    return None if text is None else round(fmi_time(text).timestamp() * 1000)
+
+def pack_float32(values: List[Optional[float]]) -> bytes:
+    """Little-endian float32 array; missing values become NaN."""
+    return struct.pack(f"<{len(values)}f", *(float("nan") if v is None else v for v in values))
+
+def compact_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Compact form of a built message for the binary encodings.
+
+    Keys: id/ts = epoch milliseconds, loc = location, fb = fallback station,
+    s = {series: {u: unit, v: value}} (combined measurements add ts/loc/fb per
+    series). Forecasts carry t0 (epoch seconds) and
+    dt (step seconds) instead of a time index, or t (epoch seconds) when the
+    steps are irregular, and v as a float32 array (see pack_float32). Deltas
+    carry kf (keyframe id), t0, h (hours) and c = {epoch seconds: value}.
+    The topic is the MQTT topic itself and is not repeated.
+    """
+    out: Dict[str, Any] = {"id": _epoch_ms(message.get("messageid", message.get("messageId")))}
+    series: Dict[str, Any] = {}
+    for key, val in message.items():
+        if key in ("messageid", "messageId", "topic", "Topic"):
+            continue
+        if key == "timestamp":
+            out["ts"] = _epoch_ms(val)
+        elif key == "location":
+            out["loc"] = val
+        elif key == "fallbackStation":
+            out["fb"] = val
+        elif key == "forecast":
+            times = [fmi_time_epoch(t) for t in val["timeindex"]]
+            steps = {b - a for a, b in zip(times, times[1:])}
+            if len(steps) <= 1:
+                out["t0"] = times[0] if times else None
+                out["dt"] = steps.pop() if steps else 3600
+            else:
+                out["t"] = times
+            for name, ser in val["series"].items():
+                series[name] = {"u": ser["UnitOfMeasure"], "v": pack_float32(ser["values"])}
+        elif key == "forecastDelta":
+            out["kf"] = _epoch_ms(val["keyframeId"])
+            out["t0"] = fmi_time_epoch(val["start"]) if val["start"] else None
+            out["h"] = val["hours"]
+            for name, ser in val["series"].items():
+                series[name] = {"u": ser["UnitOfMeasure"],
+                                "c": {fmi_time_epoch(t): v for t, v in ser["changes"].items()}}
+        elif isinstance(val, dict) and "value" in val:
+            series[key] = {"u": val.get("unit"), "v": val["value"]}
+            if "timestamp" in val:  # combined measurement entry
+                series[key].update(ts=_epoch_ms(val["timestamp"]), loc=val["location"])
+                if "fallbackStation" in val:
+                    series[key]["fb"] = val["fallbackStation"]
+        else:
+            out[key] = val
+    out["s"] = series
+    return out
+
+def _encode_cbor(message: Dict[str, Any]) -> bytes:
+    compact = compact_message(message)
+    for ser in compact["s"].values():
+        if isinstance(ser.get("v"), bytes):
+            ser["v"] = cbor2.CBORTag(CBOR_TAG_FLOAT32_LE, ser["v"])
+    return cbor2.dumps(compact)
+
+def _encode_msgpack(message: Dict[str, Any]) -> bytes:
+    return msgpack.packb(compact_message(message), use_bin_type=True)
+
+# encoding -> (encoder, required module, pip name)
+BINARY_ENCODERS = {"cbor": (_encode_cbor, cbor2, "cbor2"), "msgpack": (_encode_msgpack, msgpack, "msgpack")}
+
+def get_payload_encoder(encoding: str):
+    """Resolve PAYLOAD_ENCODING to (message -> bytes, topic suffix)."""
+    if encoding in BINARY_ENCODERS:
+        encoder, module, pip_name = BINARY_ENCODERS[encoding]
+        if module is not None:
+            return encoder, "/" + encoding
+        sys.stderr.write(f"[MQTT] {pip_name} not installed (pip install {pip_name}), publishing JSON\n")
+    elif encoding != "json":
+        sys.stderr.write(f"[MQTT] Unknown PAYLOAD_ENCODING {encoding!r}, publishing JSON\n")
+    return SERIALIZERS[json_backend], ""
+
+dumps_message, PAYLOAD_TOPIC_SUFFIX = get_payload_encoder(PAYLOAD_ENCODING)
+
+_json_value_encode = json.JSONEncoder(ensure_ascii=False).encode
+_json_encode_str = json.encoder.encode_basestring
+
+def _json_value(value) -> str:
+    """One value exactly as json.dumps(ensure_ascii=False) writes it inside a message."""
+    kind = type(value)
+    if kind is str:
+        return _json_encode_str(value)
+    if kind is float and math.isfinite(value):
+        return float.__repr__(value)
+    if value is None:
+        return "null"
+    return _json_value_encode(value)
+
+class MessageTemplate:
+    """A message layout serialized once (stdlib json), with slots for per-tick fields.
+
+    Compiled from the first message of a job and the key paths of the fields
+    that change (ids, timestamps, values). render() serializes only those and
+    splices them between the pre-serialized constant parts (keys, topic,
+    location, units), giving the same bytes as _dumps_json() on the message.
+    """
+
+    def __init__(self, sample: Dict[str, Any], slots: List[tuple]):
+        markers = {f"@@slot{i}@@": path for i, path in enumerate(slots)}
+        skeleton = _with_values(sample, {path: marker for marker, path in markers.items()})
+        text = json.dumps(skeleton, ensure_ascii=False)
+        found = sorted((text.index(f'"{m}"'), m) for m in markers)
+        self.paths = [markers[m] for _, m in found]
+        self.parts: List[str] = []
+        pos = 0
+        for at, m in found:
+            self.parts.append(text[pos:at])
+            pos = at + len(m) + 2
+        self.parts.append(text[pos:])
+
+    def render(self, message: Dict[str, Any]) -> bytes:
+        out = [self.parts[0]]
+        for path, part in zip(self.paths, self.parts[1:]):
+            value = message
+            for key in path:
+                value = value[key]
+            out.append(_json_value(value))
+            out.append(part)
+        return "".join(out).encode("utf-8")
+
+def _with_values(message: Dict[str, Any], values: Dict[tuple, Any], prefix: tuple = ()) -> Dict[str, Any]:
+    """Copy of message with the values at the given key paths replaced."""
+    out = {}
+    for key, val in message.items():
+        path = prefix + (key,)
+        if path in values:
+            out[key] = values[path]
+        elif isinstance(val, dict):
+            out[key] = _with_values(val, values, path)
+        else:
+            out[key] = val
+    return out
+
+# (topic, layout key) -> compiled template, filled on the first message of each job
+_templates: Dict[tuple, MessageTemplate] = {}
+
+def render_json(topic: str, message: Dict[str, Any], layout: Optional[tuple] = None) -> bytes:
+    """JSON payload of message plus its "Topic" field (= topic).
+
+    layout is (key, slot paths) from one of the measurement *_layout() helpers:
+    the key names every constant the builder serialized, so each job renders
+    through its own cached template. Without a layout (forecasts) the message
+    is serialized whole. Only the stdlib backend uses templates; orjson
+    encodes a whole message faster than the splicing would.
+    """
+    if layout is None or json_backend != "json":
+        return dumps_message({**message, "Topic": topic})
+    key, slots = layout
+    template = _templates.get((topic, key))
+    if template is None:
+        template = _templates[(topic, key)] = MessageTemplate({**message, "Topic": topic}, slots)
+    return template.render(message)
+
 # --- MQTT glue ----------------------------------------------------------------
 
 _connected_evt = threading.Event()
 
+class AckTracker:
+    """Tracks published messages (by mid) until paho reports them sent/acked.
+
+    For QoS 1 the on_publish callback fires on PUBACK, so the time between
+    publish() and the callback is the broker ack latency.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending: Dict[int, tuple] = {}  # mid -> (monotonic sent, topic, payload, qos, retain, meta)
+        self._early: set = set()              # acks that arrived before track()
+        self.stats = {"sent": 0, "acked": 0, "failed": 0}
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    def track(self, mid: int, topic: str, payload=None, qos: int = 0, retain: bool = False,
+              meta: Optional[tuple] = None):
+        with self._cond:
+            self.stats["sent"] += 1
+            if mid in self._early:
+                self._early.discard(mid)
+                self.stats["acked"] += 1
+                self._cond.notify_all()
+                return
+            self._pending[mid] = (time.monotonic(), topic, payload, qos, retain, meta)
+
+    def failed(self):
+        with self._cond:
+            self.stats["failed"] += 1
+
+    def on_publish(self, mid: int):
+        with self._cond:
+            entry = self._pending.pop(mid, None)
+            if entry is None:
+                self._early.add(mid)
+                return
+            latency = time.monotonic() - entry[0]
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+            self.stats["acked"] += 1
+            self._cond.notify_all()
+
+    def outstanding(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def wait_for_acks(self, timeout: Optional[float] = None) -> int:
+        """Block until every tracked message is acked or timeout passes.
+
+        Returns the number still outstanding (0 = all flushed).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return len(self._pending)
+
+    def unacked(self) -> List[tuple]:
+        """(topic, payload, qos, retain, meta) of every message still awaiting its ack."""
+        with self._cond:
+            return [entry[1:] for entry in self._pending.values()]
+
+    def report(self):
+        acked = self.stats["acked"]
+        avg = self.latency_sum / acked * 1000 if acked else 0.0
+        print("[MQTT] Acks: " + " ".join(f"{k}={v}" for k, v in self.stats.items())
+              + f" outstanding={self.outstanding()} latency_avg={avg:.0f}ms latency_max={self.latency_max * 1000:.0f}ms")
+
+acks = AckTracker()
+
+MQTT_V5 = MQTT_PROTOCOL in ("5", "5.0", "v5")
+
+class TopicAliases:
+    """MQTT v5 topic aliases for outgoing PUBLISHes.
+
+    Topics get aliases 1..maximum (the broker's Topic Alias Maximum from
+    CONNACK; 0 disables them) on their second use, so one-off topics such as
+    the status message don't take one of the few slots. The first PUBLISH of a topic on a connection
+    carries topic + alias, later ones an empty topic + alias. Aliases only
+    live as long as the connection, so reset() forgets which are established
+    and rearm() gives messages paho still holds for resending their topic back.
+    """
+
+    def __init__(self):
+        self.maximum = 0
+        self._aliases: Dict[str, int] = {}
+        self._seen: set = set()
+        self._established: set = set()
+        self._lock = threading.Lock()
+
+    def reset(self, maximum: Optional[int] = None):
+        with self._lock:
+            if maximum is not None:
+                self.maximum = maximum
+            self._established.clear()
+
+    def apply(self, topic: str, properties: Properties) -> str:
+        """Set properties.TopicAlias; returns the topic to send ('' once established)."""
+        with self._lock:
+            alias = self._aliases.get(topic)
+            if alias is None:
+                if topic not in self._seen or len(self._aliases) >= self.maximum:
+                    self._seen.add(topic)
+                    return topic
+                alias = self._aliases[topic] = len(self._aliases) + 1
+            if alias > self.maximum:
+                return topic
+            properties.TopicAlias = alias
+            if alias in self._established:
+                return ""
+            self._established.add(alias)
+            return topic
+
+    def unsent(self, alias: int):
+        """The PUBLISH meant to establish `alias` was never accepted by paho."""
+        with self._lock:
+            self._established.discard(alias)
+
+    def rearm(self, client: mqtt.Client):
+        """Restore the full topic of aliased messages queued for (re)sending.
+
+        Runs in on_connect, before paho resends them on the new connection
+        (touches paho's private outgoing queue; there is no public hook).
+        """
+        with self._lock:
+            topics = {alias: topic.encode("utf-8") for topic, alias in self._aliases.items()}
+            self._established.clear()
+        with client._out_message_mutex:
+            for m in client._out_messages.values():
+                alias = getattr(m.properties, "TopicAlias", None) if m.properties else None
+                if alias is None:
+                    continue
+                m._topic = topics[alias]
+                if alias > self.maximum:
+                    delattr(m.properties, "TopicAlias")
+
+topic_aliases = TopicAliases()
+
+def _varint_len(n: int) -> int:
+    return 1 if n < 128 else 2 if n < 16384 else 3 if n < 2097152 else 4
+
+def publish_packet_size(topic: str, payload_len: int, qos: int,
+                        properties: Optional[Properties] = None) -> int:
+    """Bytes of a PUBLISH packet on the wire (v5 when properties are given)."""
+    remaining = 2 + len(topic.encode("utf-8")) + payload_len + (2 if qos else 0)
+    if properties is not None:
+        remaining += len(properties.pack())
+    return 1 + _varint_len(remaining) + remaining
+
+# PUBLISH bytes actually sent with v5 vs the same messages as v3.1.1
+wire_stats: Dict[str, int] = {"messages": 0, "aliased": 0, "v5_bytes": 0, "v311_bytes": 0}
+
+def report_wire_stats():
+    if not wire_stats["messages"]:
+        return
+    v5, v311 = wire_stats["v5_bytes"], wire_stats["v311_bytes"]
+    print(f"[MQTT] v5 PUBLISH bytes: {v5} vs {v311} as v3.1.1 "
+          f"({v311 - v5:+d} saved, {(v311 - v5) / v311:+.1%}); "
+          f"topic alias used on {wire_stats['aliased']}/{wire_stats['messages']} messages")
+
+def _publish_tracked(client: mqtt.Client, topic: str, payload, qos: int, retain: bool,
+                     properties: Optional[Properties] = None, meta: Optional[tuple] = None) -> int:
+    """client.publish() + ack tracking. Returns paho's rc; MQTT_ERR_NO_CONN with
+    QoS>0 means paho queued the message until it reconnects. meta is the
+    message's (kind, location, created) for the outbox.
+
+    With MQTT v5 the topic alias is applied here, so every publish path uses it.
+    """
+    wire_topic = topic
+    if MQTT_V5:
+        if properties is None:
+            properties = Properties(PacketTypes.PUBLISH)
+        if MQTT_TOPIC_ALIASES:
+            wire_topic = topic_aliases.apply(topic, properties)
+    info = client.publish(wire_topic, payload=payload, qos=qos, retain=retain, properties=properties)
+    rc = info[0]
+    if rc == mqtt.MQTT_ERR_SUCCESS or (rc == mqtt.MQTT_ERR_NO_CONN and qos > 0):
+        acks.track(info[1], topic, payload, qos, retain, meta)
+        if MQTT_V5:
+            size = len(payload.encode("utf-8")) if isinstance(payload, str) else len(payload)
+            wire_stats["messages"] += 1
+            wire_stats["aliased"] += wire_topic != topic
+            wire_stats["v5_bytes"] += publish_packet_size(wire_topic, size, qos, properties)
+            wire_stats["v311_bytes"] += publish_packet_size(topic, size, qos)
+    else:
+        acks.failed()
+        if wire_topic and hasattr(properties, "TopicAlias"):
+            topic_aliases.unsent(properties.TopicAlias)
+    return rc
+
+class Outbox:
+    """Bounded, disk-backed queue of outbound MQTT messages (SQLite).
+
+    Messages are kept oldest-first; beyond max_messages the oldest (or the
+    incoming one, per drop_policy) is dropped, and anything older than max_age
+    seconds is expired. drain() republishes at most drain_rate messages/s while
+    the client is connected, deleting each row once paho accepted it.
+    """
+
+    def __init__(self, path: str, max_messages: int, max_age: float,
+                 drop_policy: str = "oldest", drain_rate: float = 20.0):
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self.drop_policy = drop_policy
+        self.drain_rate = drain_rate
+        self.stats = {"queued": 0, "dropped": 0, "expired": 0, "drained": 0}
+        self.opened = time.time()  # rows created since then belong to this run
+        self._lock = threading.Lock()
+        self._drainer: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT NOT NULL, payload BLOB NOT NULL,"
+            " qos INTEGER NOT NULL, retain INTEGER NOT NULL, created REAL NOT NULL,"
+            " kind TEXT, location TEXT)")
+        # outboxes from older versions lack the columns v5 properties are rebuilt from
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(outbox)")}
+        for column in ("kind", "location"):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE outbox ADD COLUMN {column} TEXT")
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def _expire(self):
+        cur = self._db.execute("DELETE FROM outbox WHERE created < ?", (time.time() - self.max_age,))
+        self.stats["expired"] += cur.rowcount
+
+    def put(self, topic: str, payload, qos: int, retain: bool, kind: Optional[str] = None,
+            location: Optional[str] = None, created: Optional[float] = None) -> bool:
+        """Queue a message; False if it was dropped because the queue is full.
+
+        kind / location / created (epoch seconds, default now) let the drain
+        send the message's MQTT v5 properties with its remaining expiry.
+        """
+        with self._lock:
+            self._expire()
+            count = self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+            if count >= self.max_messages:
+                if self.drop_policy == "newest":
+                    self.stats["dropped"] += 1
+                    return False
+                excess = count - self.max_messages + 1
+                self._db.execute(
+                    "DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id LIMIT ?)", (excess,))
+                self.stats["dropped"] += excess
+            self._db.execute(
+                "INSERT INTO outbox (topic, payload, qos, retain, created, kind, location)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (topic, payload, qos, int(retain), time.time() if created is None else created,
+                 kind, location))
+            self.stats["queued"] += 1
+            return True
+
+    def start_drain(self, client: mqtt.Client):
+        """Start the drain thread unless one is already running."""
+        with self._lock:
+            if self._stop.is_set() or (self._drainer is not None and self._drainer.is_alive()):
+                return
+            self._drainer = threading.Thread(target=self._drain, args=(client,),
+                                             name="outbox-drain", daemon=True)
+            self._drainer.start()
+
+    def _drain(self, client: mqtt.Client):
+        interval = 1.0 / self.drain_rate if self.drain_rate > 0 else 0.0
+        while True:
+            with self._lock:
+                row = None
+                if _connected_evt.is_set() and not self._stop.is_set():
+                    self._expire()
+                    row = self._db.execute(
+                        "SELECT id, topic, payload, qos, retain, created, kind, location"
+                        " FROM outbox ORDER BY id LIMIT 1").fetchone()
+                if row is None:
+                    # decided under the lock put() / start_drain() take, so a row
+                    # queued meanwhile starts a new drainer instead of being stranded
+                    self._drainer = None
+                    break
+            msg_id, topic, payload, qos, retain, created, kind, location = row
+            age = max(0.0, time.time() - created)
+            expiry = message_expiry(kind, bool(retain)) if kind else 0
+            if MQTT_V5 and expiry and age >= expiry:
+                # the broker would have discarded it by now as well
+                with self._lock:
+                    self._db.execute("DELETE FROM outbox WHERE id = ?", (msg_id,))
+                self.stats["expired"] += 1
+                continue
+            props = publish_properties(topic, kind, bool(retain), location, age)
+            rc = _publish_tracked(client, topic, payload, qos, bool(retain), props, (kind, location, created))
+            # NO_CONN with QoS>0: paho queued it (and acks tracks it), so it is handed over
+            if rc != mqtt.MQTT_ERR_SUCCESS and not (rc == mqtt.MQTT_ERR_NO_CONN and qos > 0):
+                # connection going away (or paho's queue full): retry unless disconnected
+                self._stop.wait(max(interval, 1.0))
+                continue
+            with self._lock:
+                self._db.execute("DELETE FROM outbox WHERE id = ?", (msg_id,))
+            self.stats["drained"] += 1
+            if interval:
+                self._stop.wait(interval)
+        if not self._stop.is_set() and self.pending():
+            print(f"[MQTT] Outbox: {self.pending()} message(s) waiting for reconnect")
+
+    def report(self):
+        print(f"[MQTT] Outbox: pending={self.pending()} " + " ".join(f"{k}={v}" for k, v in self.stats.items()))
+
+    def pending_since(self, created: float) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox WHERE created >= ?", (created,)).fetchone()[0]
+
+    def flush(self, client: mqtt.Client, timeout: float) -> int:
+        """Keep draining while connected until the outbox is empty or timeout
+        passes. Returns the number of rows still pending."""
+        t_end = time.monotonic() + timeout
+        while True:
+            n = self.pending()
+            remaining = t_end - time.monotonic()
+            if n == 0 or remaining <= 0 or not _connected_evt.is_set():
+                return n
+            self.start_drain(client)
+            time.sleep(min(0.1, remaining))
+
+    def stop_drain(self, timeout: float = 5.0):
+        """Stop the drain thread (for good) and wait for it to finish."""
+        self._stop.set()
+        drainer = self._drainer
+        if drainer is not None:
+            drainer.join(timeout)
+
+    def close(self):
+        self.stop_drain()
+        with self._lock:
+            self._db.close()
+
+_outbox: Optional[Outbox] = None
+
+def open_outbox() -> Optional[Outbox]:
+    """Create the module outbox from OUTBOX_* settings (None when disabled)."""
+    global _outbox
+    if OUTBOX_PATH and _outbox is None:
+        _outbox = Outbox(OUTBOX_PATH, OUTBOX_MAX_MESSAGES, OUTBOX_MAX_AGE_SEC,
+                         OUTBOX_DROP_POLICY, OUTBOX_DRAIN_RATE)
+        n = _outbox.pending()
+        if n:
+            print(f"[MQTT] Outbox: {n} message(s) left from a previous run")
+    return _outbox
+
 def make_mqtt_client() -> mqtt.Client:
-    client = mqtt.Client(client_id=MQTT_CLIENT_ID)
+    if MQTT_V5:
+        client = mqtt.Client(client_id=MQTT_CLIENT_ID, protocol=mqtt.MQTTv5)
+    else:
+        client = mqtt.Client(client_id=MQTT_CLIENT_ID)
     if MQTT_USERNAME:
         client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
     if MQTT_TLS:
@@ -316,43 +1741,467 @@ def make_mqtt_client() -> mqtt.Client:
 
     def on_connect(client, userdata, flags, rc, properties=None):
         if rc == 0:
+            if MQTT_V5:
+                topic_aliases.reset(getattr(properties, "TopicAliasMaximum", 0))
+                topic_aliases.rearm(client)
             _connected_evt.set()
             # Announce online
-            client.publish("WeatherMeasurement/status", payload="online", qos=1, retain=True)
-            print(f"[MQTT] Connected to {MQTT_BROKER}:{MQTT_PORT}")
+            _publish_tracked(client, "WeatherMeasurement/status", "online", 1, True)
+            print(f"[MQTT] Connected to {MQTT_BROKER}:{MQTT_PORT}"
+                  + (f" (MQTT v5, {topic_aliases.maximum} topic aliases)" if MQTT_V5 else ""))
+            if _outbox is not None:
+                _outbox.start_drain(client)
         else:
             print(f"[MQTT] Connect failed with rc={rc}")
 
     def on_disconnect(client, userdata, rc, properties=None):
         _connected_evt.clear()
+        topic_aliases.reset()  # aliases die with the connection
         print(f"[MQTT] Disconnected (rc={rc}). Reconnecting…")
 
+    def on_publish(client, userdata, mid, *args):
+        acks.on_publish(mid)
+
     client.on_connect = on_connect
     client.on_disconnect = on_disconnect
+    client.on_publish = on_publish
+    client.max_inflight_messages_set(MQTT_MAX_INFLIGHT)
+    client.max_queued_messages_set(MQTT_MAX_QUEUED)
 
     # Start networking thread and connect (async -> auto reconnect)
     client.loop_start()
     client.connect_async(MQTT_BROKER, MQTT_PORT, MQTT_KEEPALIVE)
     return client
 
-def publish_json(client: mqtt.Client, topic: str, message: Dict[str, Any]):
-    """Ensure Topic field, publish JSON to MQTT, and optionally print payload."""
-    message["Topic"] = topic  # guarantee correctness
-    payload = json.dumps(message, ensure_ascii=False)
-    # Wait for connection (non-blocking retry if broker not up yet)
-    if not _connected_evt.is_set():
-        # wait a short time the first time; background thread will reconnect
-        _connected_evt.wait(timeout=5.0)
-    rc = client.publish(topic, payload=payload, qos=MQTT_QOS, retain=MQTT_RETAIN)[0]
+# JSON (the default) goes untagged; every property byte is paid per message
+PAYLOAD_CONTENT_TYPES = {"/cbor": "application/cbor", "/msgpack": "application/msgpack"}
+
+def message_kind(message: Dict[str, Any]) -> str:
+    return next((k for k in ("forecast", "forecastDelta") if k in message), "measurement")
+
+def message_expiry(kind: str, retain: bool = False) -> int:
+    """MessageExpiryInterval (seconds, 0 = none) for a message kind."""
+    if kind == "measurement":
+        return MQTT_MEAS_EXPIRY_SEC
+    if retain and kind == "forecast" and FC_PUBLISH_MODE == "delta" and MQTT_FC_EXPIRY_SEC:
+        # the retained keyframe is the base of every delta until the next one,
+        # due FC_KEYFRAME_HOURS later (on the following hourly run)
+        return max(MQTT_FC_EXPIRY_SEC, (FC_KEYFRAME_HOURS + 1) * 3600)
+    return MQTT_FC_EXPIRY_SEC
+
+def publish_properties(topic: str, kind: Optional[str], retain: bool = False,
+                       location: Optional[str] = None, age: float = 0.0) -> Optional[Properties]:
+    """MQTT v5 PUBLISH properties (None with v3.1.1): expiry by message kind
+    (less the age of a message sent late), content type of binary encodings
+    (by topic suffix), user properties. kind None = unknown (no expiry)."""
+    if not MQTT_V5:
+        return None
+    props = Properties(PacketTypes.PUBLISH)
+    expiry = message_expiry(kind, retain) if kind else 0
+    if expiry:
+        props.MessageExpiryInterval = max(1, math.ceil(expiry - age))
+    content_type = next((ct for sfx, ct in PAYLOAD_CONTENT_TYPES.items() if topic.endswith(sfx)), None)
+    if content_type:
+        props.ContentType = content_type
+    user_props = [(str(k), str(v)) for k, v in MQTT_USER_PROPERTIES.items()]
+    if MQTT_META_PROPERTIES and kind:
+        user_props.append(("kind", kind))
+        if location:
+            user_props.append(("location", location))
+    if user_props:
+        props.UserProperty = user_props
+    return props
+
+# Messages publish_json() lost outright (rejected by paho, outbox full)
+publish_stats: Dict[str, int] = {"rejected": 0}
+
+def publish_json(client: mqtt.Client, topic: str, message: Dict[str, Any],
+                 retain: Optional[bool] = None, layout: Optional[tuple] = None) -> bool:
+    """Publish the message to MQTT (JSON with a "Topic" field, or PAYLOAD_ENCODING
+    on the suffixed topic), and optionally print payload.
+
+    Never blocks: while disconnected, QoS>0 messages wait in paho's bounded
+    queue (or the outbox, if enabled); QoS 0 ones go to the outbox or are lost. Returns True if the message was accepted;
+    delivery is tracked by `acks`. layout: see render_json().
+    """
+    if PAYLOAD_TOPIC_SUFFIX:
+        payload = dumps_message(message)
+    else:
+        payload = render_json(topic, message, layout)  # adds the "Topic" field
+    topic += PAYLOAD_TOPIC_SUFFIX
+    retain = MQTT_RETAIN if retain is None else retain
+    kind, location = message_kind(message), str(message.get("location") or "") or None
+    # Offline (or still draining a backlog): queue on disk instead of waiting,
+    # so order is kept and memory stays bounded
+    if _outbox is not None and (not _connected_evt.is_set() or _outbox.pending()):
+        if not _outbox.put(topic, payload, MQTT_QOS, retain, kind, location):
+            sys.stderr.write(f"[MQTT] Outbox full, dropped message on topic {topic}\n")
+            publish_stats["rejected"] += 1
+            return False
+        print(f"[MQTT] queued {topic} ({len(payload)} bytes, {_outbox.pending()} pending)")
+        if _connected_evt.is_set():
+            _outbox.start_drain(client)
+        return True
+    rc = _publish_tracked(client, topic, payload, MQTT_QOS, retain,
+                          publish_properties(topic, kind, retain, location), (kind, location, time.time()))
+    # paho discards QoS 0 messages while disconnected; the outbox keeps them
+    if (rc == mqtt.MQTT_ERR_QUEUE_SIZE or (rc == mqtt.MQTT_ERR_NO_CONN and MQTT_QOS == 0)) \
+            and _outbox is not None:
+        if _outbox.put(topic, payload, MQTT_QOS, retain, kind, location):
+            return True
+        sys.stderr.write(f"[MQTT] Outbox full, dropped message on topic {topic}\n")
+        publish_stats["rejected"] += 1
+        return False
+    if rc == mqtt.MQTT_ERR_NO_CONN and MQTT_QOS > 0:
+        print(f"[MQTT] -> {topic} ({len(payload)} bytes, queued until connected)")
+        return True
     if rc != mqtt.MQTT_ERR_SUCCESS:
         sys.stderr.write(f"[MQTT] Publish failed rc={rc} on topic {topic}\n")
+        publish_stats["rejected"] += 1
+        return False
+    print(f"[MQTT] -> {topic} ({len(payload)} bytes)")
+    if PRINT_JSON_TO_STDOUT:
+        print(payload.decode("utf-8") if not PAYLOAD_TOPIC_SUFFIX else compact_message(message))
+    return True
+
+# Delta publishing state: topic -> (observation key, monotonic time of last publish)
+_meas_published: Dict[str, tuple] = {}
+dedup_stats: Dict[str, int] = {"published": 0, "suppressed": 0}
+
+def publish_measurement(client: mqtt.Client, topic: str, message: Dict[str, Any],
+                        observations: List[tuple], layout: Optional[tuple] = None):
+    """publish_json() for a measurement, honouring MEAS_DEDUP / MEAS_HEARTBEAT_SEC.
+
+    observations: (latest row, fallback station) of each series in the message.
+    They are unchanged when time, value and source station are the same as in
+    the last message published on the topic. Messages missing data are always
+    published.
+    """
+    if not MEAS_DEDUP or any(latest is None for latest, _ in observations):
+        publish_json(client, topic, message, layout=layout)
+        return
+    obs_key = tuple((latest["time"], latest["value"], fb) for latest, fb in observations)
+    prev = _meas_published.get(topic)
+    now = time.monotonic()
+    if prev is not None and prev[0] == obs_key and not (
+            MEAS_HEARTBEAT_SEC and now - prev[1] >= MEAS_HEARTBEAT_SEC):
+        dedup_stats["suppressed"] += 1
+        print(f"[MQTT] -- {topic} unchanged since {message['timestamp']}, suppressed "
+              f"({dedup_stats['suppressed']} so far)")
+        return
+    if publish_json(client, topic, message, layout=layout):
+        dedup_stats["published"] += 1
+        _meas_published[topic] = (obs_key, now)
+
+def publish_forecasts(client: mqtt.Client, targets: List[tuple], hours: int):
+    """Fetch forecasts for all targets (one request if several) and publish them.
+
+    targets: list of (location_str, loc, temp_topic, irr_topic)
+    """
+    if len(targets) == 1:
+        fcs = [fetch_hourly_forecast(targets[0][1], hours)]
     else:
-        print(f"[MQTT] -> {topic} ({len(payload)} bytes)")
-        if PRINT_JSON_TO_STDOUT:
-            print(payload)
+        fcs = fetch_hourly_forecast_multi([t[1] for t in targets], hours)
+    for (location_str, _loc, temp_topic, irr_topic), fc in zip(targets, fcs):
+        publish_forecast(client, "Temperature", "Cel", temp_topic, location_str, fc["times"], fc["temp_vals"])
+        publish_forecast(client, "Irradiance", "W/m2", irr_topic, location_str, fc["times"], fc["irr_vals"])
+
+# Forecast diff state: topic -> keyframe {"id", "values": {time: value}, "at": datetime}
+_fc_keyframes: Dict[str, Dict[str, Any]] = {}
+
+def same_value(a: Optional[float], b: Optional[float]) -> bool:
+    """a == b, except that two NaNs (a gap FMI sends as NaN) count as equal."""
+    return a == b or (a != a and b != b)
+
+def publish_forecast(client: mqtt.Client, series_name: str, unit: str, topic: str,
+                     location_str: str, times: List[datetime], values: List[Optional[float]]):
+    """Publish one forecast series according to FC_PUBLISH_MODE."""
+    if FC_PUBLISH_MODE not in ("on-change", "delta"):
+        publish_json(client, topic, build_forecast_msg(series_name, unit, topic, location_str, times, values))
+        return
+    now = datetime.now(timezone.utc)
+    key = _fc_keyframes.get(topic)
+    changes: Dict[datetime, Optional[float]] = {}
+    if key is not None:
+        base = key["values"]
+        changes = {t: v for t, v in zip(times, values) if t not in base or not same_value(base[t], v)}
+    # Full snapshot when due, or when most of the window changed (new model run)
+    if (key is None or now - key["at"] >= timedelta(hours=FC_KEYFRAME_HOURS)
+            or (FC_PUBLISH_MODE == "delta" and len(changes) > len(times) // 2)):
+        msg = build_forecast_msg(series_name, unit, topic, location_str, times, values)
+        # retained in delta mode, so new subscribers always have a base for the deltas
+        if publish_json(client, topic, msg, retain=True if FC_PUBLISH_MODE == "delta" else None):
+            _fc_keyframes[topic] = {"id": msg["messageId"], "values": dict(zip(times, values)), "at": now}
+        return
+    base = key["values"]
+    if FC_PUBLISH_MODE == "on-change":
+        # A pure time shift of the same run (only new hours at the tail) is not a change
+        if all(t not in base for t in changes):
+            print(f"[MQTT] -- {topic} forecast unchanged, not republished")
+            return
+        msg = build_forecast_msg(series_name, unit, topic, location_str, times, values)
+        if publish_json(client, topic, msg):
+            _fc_keyframes[topic] = {"id": msg["messageId"], "values": dict(zip(times, values)), "at": now}
+        return
+    publish_json(client, topic, build_forecast_delta_msg(series_name, unit, topic, location_str,
+                                                         key["id"], times, changes))
+
+def primary_station_name(places: List[str], default: str) -> str:
+    """Human name of the primary station of a fallback chain (or the default place)."""
+    return split_place(places[0])[1] if places else default
+
+def publish_measurements(client: mqtt.Client, default_place: str,
+                         temp: Optional[tuple] = None, irr: Optional[tuple] = None):
+    """Fetch (unless both are given) and publish both measurement messages
+    (or, with MEAS_COMBINED, one message carrying both).
+
+    temp / irr are (latest_row, fallback_station) results of fetch_measurement_chains().
+    """
+    if temp is None or irr is None:
+        temp, irr = fetch_measurement_chains()
+    latest_t, temp_fallback_station = temp
+    latest_g, irr_fallback_station = irr
+
+    # Keep location field as the PRIMARY station name
+    temp_primary = primary_station_name(TEMP_MEAS_PLACES, default_place)
+    irr_primary = primary_station_name(IRR_MEAS_PLACES, default_place)
+    if MEAS_COMBINED:
+        series = {
+            "temperature": ("Cel", latest_t, temp_primary, temp_fallback_station),
+            "irradiance": ("W/m2", latest_g, irr_primary, irr_fallback_station),
+        }
+        msg = build_combined_measurement_msg(TOPIC_MEAS_COMBINED, default_place, series)
+        publish_measurement(client, TOPIC_MEAS_COMBINED, msg, [temp, irr],
+                            combined_measurement_layout(default_place, series))
+        return
+    temp_msg = build_temp_measurement_msg(TOPIC_TEMP_MEAS, temp_primary, latest_t, temp_fallback_station)
+    irr_msg  = build_irr_measurement_msg(TOPIC_IRR_MEAS,  irr_primary,  latest_g, irr_fallback_station)
+
+    publish_measurement(client, TOPIC_TEMP_MEAS, temp_msg, [temp],
+                        measurement_layout("temperature", temp_primary, temp_fallback_station))
+    publish_measurement(client, TOPIC_IRR_MEAS,  irr_msg,  [irr],
+                        measurement_layout("irradiance", irr_primary, irr_fallback_station))
+
+# --- Job scheduling -------------------------------------------------------------
+
+def floor_to_period(dt: datetime, period: timedelta) -> datetime:
+    """Start of the UTC period slot (minute, hour, ...) containing dt."""
+    step = int(period.total_seconds())
+    epoch = int(dt.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % step, timezone.utc)
+
+class PeriodicJob:
+    """Runs fn(slot) once per period slot on its own worker thread.
+
+    Slots are aligned to UTC period boundaries (hh:mm:00 for minutes, hh:00 for
+    hours), but deadlines are tracked on the monotonic clock from a fixed anchor,
+    so sleeps never accumulate drift and wall-clock steps cannot fire a slot
+    twice. Each job type has its own worker, so a slow job never delays another.
+
+    A run that overruns makes the next slot run late rather than be dropped; up
+    to max_catchup overdue slots are run back to back, anything older is skipped
+    (counted) and the worker resumes at the current slot.
+
+    With lead_fn, each run starts lead_fn() seconds before its boundary; fn can
+    call wait_for_slot(slot) to hold its output until the boundary.
+    """
+
+    def __init__(self, name: str, period: timedelta, fn, max_catchup: int = 0, lead_fn=None):
+        self.name = name
+        self.period = period
+        self.fn = fn
+        self.max_catchup = max_catchup
+        self.lead_fn = lead_fn  # optional: seconds to start each run before its slot boundary
+        self.last_slot: Optional[datetime] = None
+        self.runs = 0
+        self.overruns = 0       # runs that took longer than one period
+        self.late_runs = 0      # runs started more than half a period after their slot
+        self.skipped = 0        # slots never run
+        self.lag_last = 0.0     # seconds between slot boundary and run start
+        self.lag_max = 0.0
+        self.lag_sum = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._worker, name=f"job-{name}", daemon=True)
+        self._anchor()
+
+    def _anchor(self):
+        self._anchor_mono = time.monotonic()
+        self._anchor_wall = datetime.now(timezone.utc)
+
+    def _mono_at(self, slot: datetime) -> float:
+        return self._anchor_mono + (slot - self._anchor_wall).total_seconds()
+
+    def _wall_now(self) -> datetime:
+        return self._anchor_wall + timedelta(seconds=time.monotonic() - self._anchor_mono)
+
+    def start(self):
+        self._thread.start()
+
+    def wait_for_slot(self, slot: datetime) -> bool:
+        """Sleep until the slot boundary; False if the job is being stopped."""
+        delay = self._mono_at(slot) - time.monotonic()
+        return not (delay > 0 and self._stop.wait(delay))
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """Stop scheduling; wait up to timeout for a running tick. True once finished."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "overruns": self.overruns,
+            "late_runs": self.late_runs,
+            "skipped": self.skipped,
+            "lag_last_ms": round(self.lag_last * 1000),
+            "lag_max_ms": round(self.lag_max * 1000),
+            "lag_avg_ms": round(self.lag_sum / self.runs * 1000) if self.runs else 0,
+        }
+
+    def report(self):
+        m = self.metrics()
+        print(f"[SCHED] {self.name}: " + " ".join(f"{k}={v}" for k, v in m.items()))
+
+    def _worker(self):
+        period_s = self.period.total_seconds()
+        while not self._stop.is_set():
+            # Re-anchor if the wall clock was stepped (NTP) by more than a second
+            if abs((datetime.now(timezone.utc) - self._wall_now()).total_seconds()) > 1.0:
+                sys.stderr.write(f"[SCHED] {self.name}: wall clock stepped, re-anchoring\n")
+                self._anchor()
+            if self.last_slot is None:
+                slot = floor_to_period(self._wall_now(), self.period) + self.period
+            else:
+                slot = self.last_slot + self.period
+            lead = self.lead_fn() if self.lead_fn else 0.0
+            start_at = self._mono_at(slot) - lead
+            delay = start_at - time.monotonic()
+            if delay > 0 and self._stop.wait(delay):
+                break
+            current = floor_to_period(self._wall_now() + timedelta(seconds=lead), self.period)
+            behind = int((current - slot) / self.period)
+            if behind > self.max_catchup:
+                skip = behind - self.max_catchup
+                self.skipped += skip
+                slot += skip * self.period
+                sys.stderr.write(f"[SCHED] {self.name}: skipped {skip} slot(s)\n")
+            lag = time.monotonic() - (self._mono_at(slot) - lead)
+            self.lag_last = lag
+            self.lag_max = max(self.lag_max, lag)
+            self.lag_sum += lag
+            if lag >= period_s / 2:
+                self.late_runs += 1
+                sys.stderr.write(f"[SCHED] {self.name}: slot {iso_z(slot)} running {lag:.1f}s late\n")
+            self.last_slot = slot
+            self.runs += 1
+            t0 = time.monotonic()
+            try:
+                self.fn(slot)
+            except Exception as e:
+                sys.stderr.write(f"[SCHED] {self.name} job failed: {e}\n")
+            if time.monotonic() - t0 > period_s:
+                self.overruns += 1
+            if SCHED_REPORT_EVERY and self.runs % SCHED_REPORT_EVERY == 0:
+                self.report()
+
+class LeadTimeEstimator:
+    """Learns how early to start a fetch so its result is ready at the boundary.
+
+    Keeps the last `window` fetch durations; lead = p95 + margin, clamped to
+    [0, max_lead]. Also records how far from the boundary each publish landed.
+    """
+
+    def __init__(self, initial: float, max_lead: float, margin: float, window: int = 60):
+        self.initial = initial
+        self.max_lead = max_lead
+        self.margin = margin
+        self.durations: deque = deque(maxlen=window)
+        self.offsets: deque = deque(maxlen=window)
+
+    def observe(self, duration: float):
+        self.durations.append(duration)
+
+    def observe_publish(self, offset: float):
+        self.offsets.append(offset)
+
+    def p95(self) -> Optional[float]:
+        if not self.durations:
+            return None
+        ordered = sorted(self.durations)
+        return ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+
+    def lead(self) -> float:
+        p95 = self.p95()
+        if p95 is None:
+            return min(self.initial, self.max_lead)
+        return max(0.0, min(self.max_lead, p95 + self.margin))
+
+    def report(self):
+        p95 = self.p95()
+        late = [o for o in self.offsets if o > 0.1]  # >100 ms past the boundary
+        print(f"[SCHED] prefetch: lead={self.lead():.2f}s p95_fetch="
+              f"{'-' if p95 is None else f'{p95:.2f}s'} "
+              f"late_publishes={len(late)}/{len(self.offsets)} "
+              f"max_late={max(late) if late else 0.0:.2f}s")
 
 # --- Runner -------------------------------------------------------------------
 
+def shutdown(client: mqtt.Client) -> int:
+    """Flush outstanding publishes, stop MQTT networking, release resources.
+
+    Within MQTT_FLUSH_TIMEOUT, drains the outbox backlog (this run's messages
+    may be queued behind it) and waits for the PUBACKs of every tracked message.
+    Messages still unacknowledged are saved to the outbox when one is enabled
+    (and resent by the next run); otherwise they are lost. Returns the number
+    of this run's messages that did not reach the broker: lost, rejected during
+    the run (see publish_stats), or still in the outbox.
+    """
+    t_end = time.monotonic() + MQTT_FLUSH_TIMEOUT
+    acked_before = acks.stats["acked"]
+    if _outbox is not None:
+        _outbox.flush(client, MQTT_FLUSH_TIMEOUT)
+        _outbox.stop_drain()  # rows not yet handed to paho stay queued for the next run
+    outstanding = acks.outstanding()
+    remaining = acks.wait_for_acks(max(0.0, t_end - time.monotonic())) if outstanding else 0
+    saved = dropped = 0
+    if remaining:
+        for topic, payload, qos, retain, meta in acks.unacked():
+            # meta (kind, location, created) keeps the remaining v5 expiry right
+            if (_outbox is not None and payload is not None
+                    and _outbox.put(topic, payload, qos, retain, *(meta or ()))):
+                saved += 1
+            else:
+                dropped += 1
+    rejected = publish_stats["rejected"]
+    queued = _outbox.pending_since(_outbox.opened) if _outbox is not None else 0
+    print(f"[MQTT] Shutdown flush: {acks.stats['acked'] - acked_before} acked, {saved} saved to outbox, {dropped} dropped, "
+          f"{rejected} rejected, {queued} of this run's messages left in the outbox")
+    dropped += rejected + queued
+    client.disconnect()
+    client.loop_stop()
+    close_http_session()
+    acks.report()
+    report_wire_stats()
+    if _outbox is not None:
+        _outbox.report()
+        _outbox.close()
+    return dropped
+
+def parse_fc_location(item: str):
+    """'Label|place' or 'Label|lat,lon' (label optional) -> (label, loc dict)"""
+    label, spec = item.split("|", 1) if "|" in item else (item, item)
+    label, spec = label.strip(), spec.strip()
+    parts = spec.split(",")
+    if len(parts) == 2:
+        try:
+            lat, lon = float(parts[0]), float(parts[1])
+            return label, {"latlon": f"{lat:.6f},{lon:.6f}"}
+        except ValueError:
+            pass
+    return label, {"place": spec}
+
 def main():
     ap = argparse.ArgumentParser()
     g = ap.add_mutually_exclusive_group(required=False)
@@ -361,6 +2210,8 @@ def main():
     ap.add_argument("--lon", type=float)
     ap.add_argument("--hours", type=int, default=36, help="Forecast horizon (hours)")
     ap.add_argument("--once", action="store_true", help="Publish measurements now and forecasts once, then exit")
+    ap.add_argument("--fc-location", action="append", default=[],
+                    help="Forecast location 'Label|place' or 'Label|lat,lon' (repeatable; overrides --place/--lat/--lon)")
     args = ap.parse_args()
 
     # Location selection
@@ -372,68 +2223,34 @@ def main():
         loc = {"place": args.place or DEFAULT_PLACE}
         location_str = loc["place"]
 
-    # MQTT client
+    # Forecast targets: (location_str, loc, temp topic, irr topic)
+    fc_items = args.fc_location or FC_LOCATIONS
+    if fc_items:
+        fc_targets = []
+        for item in fc_items:
+            label, fc_loc = parse_fc_location(item)
+            fc_targets.append((label, fc_loc,
+                               TOPIC_TEMP_FC_TEMPLATE.format(location=label),
+                               TOPIC_IRR_FC_TEMPLATE.format(location=label)))
+    else:
+        fc_targets = [(location_str, loc, TOPIC_TEMP_FC, TOPIC_IRR_FC)]
+
+    # MQTT client (outbox first, so queued messages drain on the first connect)
+    open_outbox()
     client = make_mqtt_client()
 
     # --- One-shot mode --------------------------------------------------------
     if args.once:
+        # Publishing never blocks, so give connect_async() a moment first:
+        # without a connection paho would discard every QoS 0 message
+        if not _connected_evt.wait(MQTT_CONNECT_WAIT):
+            sys.stderr.write(f"[MQTT] Not connected to {MQTT_BROKER}:{MQTT_PORT} after "
+                             f"{MQTT_CONNECT_WAIT:.0f}s, publishing anyway\n")
         try:
             # Measurements with per-parameter fallback lists
-            if TEMP_MEAS_PLACES:
-                _temp_primary_id, temp_primary = TEMP_MEAS_PLACES[0].split("|", 1)
-            else:
-                temp_primary = (args.place or DEFAULT_PLACE)
-
-            if IRR_MEAS_PLACES:
-                _irr_primary_id, irr_primary = IRR_MEAS_PLACES[0].split("|", 1)
-            else:
-                irr_primary = (args.place or DEFAULT_PLACE)
-
-            latest_t: Optional[Dict[str, Any]] = None
-            latest_g: Optional[Dict[str, Any]] = None
-            temp_fallback_station: Optional[str] = None
-            irr_fallback_station: Optional[str] = None
-
-            # Temperature: try places in order until we get a value
-            for i, item in enumerate(TEMP_MEAS_PLACES or []):
-                fmisid, name = item.split("|", 1)
-                try:
-                    got = fetch_latest_measurements({"fmisid": fmisid})
-                except (requests.HTTPError, requests.RequestException) as e:
-                    sys.stderr.write(f"[FMI] Temp station failed (fmisid={fmisid}, name={name}): {e}\n")
-                    continue
-                if got["t"] is not None:
-                    latest_t = got["t"]
-                    if i != 0:
-                        temp_fallback_station = name
-                    break
+            publish_measurements(client, args.place or DEFAULT_PLACE)
 
-            # Irradiance: try places in order until we get a value
-            for i, item in enumerate(IRR_MEAS_PLACES or []):
-                fmisid, name = item.split("|", 1)
-                try:
-                    got = fetch_latest_measurements({"fmisid": fmisid})
-                except (requests.HTTPError, requests.RequestException) as e:
-                    sys.stderr.write(f"[FMI] Irr station failed (fmisid={fmisid}, name={name}): {e}\n")
-                    continue
-                if got["g"] is not None:
-                    latest_g = got["g"]
-                    if i != 0:
-                        irr_fallback_station = name
-                    break
-
-            # Keep location field as the PRIMARY station name
-            temp_msg = build_temp_measurement_msg(TOPIC_TEMP_MEAS, temp_primary, latest_t, temp_fallback_station)
-            irr_msg  = build_irr_measurement_msg(TOPIC_IRR_MEAS,  irr_primary,  latest_g, irr_fallback_station)
-
-            publish_json(client, TOPIC_TEMP_MEAS, temp_msg)
-            publish_json(client, TOPIC_IRR_MEAS,  irr_msg)
-
-            fc = fetch_hourly_forecast(loc, args.hours)
-            temp_fc_msg = build_forecast_msg("Temperature", "Cel", TOPIC_TEMP_FC, location_str, fc["times"], fc["temp_vals"])
-            irr_fc_msg  = build_forecast_msg("Irradiance", "W/m2", TOPIC_IRR_FC, location_str, fc["times"], fc["irr_vals"])
-            publish_json(client, TOPIC_TEMP_FC, temp_fc_msg)
-            publish_json(client, TOPIC_IRR_FC, irr_fc_msg)
+            publish_forecasts(client, fc_targets, args.hours)
         except requests.HTTPError as e:
             sys.stderr.write(f"HTTP error from FMI: {e}\n")
             sys.exit(1)
@@ -441,89 +2258,82 @@ def main():
             sys.stderr.write(f"Network error: {e}\n")
             sys.exit(1)
         finally:
-            time.sleep(0.2)  # let async network flush
-            client.loop_stop()
-            client.disconnect()
+            dropped = shutdown(client)
+        if dropped:
+            # cron must notice: these messages never reached the broker
+            sys.stderr.write(f"[MQTT] {dropped} message(s) never reached the broker\n")
+            sys.exit(1)
         return
 
     # --- Continuous mode ------------------------------------------------------
-    last_forecast_hour: Optional[int] = None
+    lead_est = LeadTimeEstimator(PREFETCH_INITIAL_LEAD, PREFETCH_MAX_LEAD, PREFETCH_MARGIN) if PREFETCH else None
 
-    try:
-        while True:
-            # sleep until next minute boundary
-            now = datetime.now(timezone.utc)
-            wake = ceil_to_minute(now)
-            time.sleep((wake - now).total_seconds())
-
-            # 1) Measurements (every minute)
-            try:
+    def measurement_tick(slot: datetime):
+        try:
+            if lead_est is None:
                 # Measurements with per-parameter fallback lists
-                if TEMP_MEAS_PLACES:
-                    _temp_primary_id, temp_primary = TEMP_MEAS_PLACES[0].split("|", 1)
-                else:
-                    temp_primary = (args.place or DEFAULT_PLACE)
-
-                if IRR_MEAS_PLACES:
-                    _irr_primary_id, irr_primary = IRR_MEAS_PLACES[0].split("|", 1)
-                else:
-                    irr_primary = (args.place or DEFAULT_PLACE)
-
-                latest_t: Optional[Dict[str, Any]] = None
-                latest_g: Optional[Dict[str, Any]] = None
-                temp_fallback_station: Optional[str] = None
-                irr_fallback_station: Optional[str] = None
-
-                # Temperature
-                for i, item in enumerate(TEMP_MEAS_PLACES or []):
-                    fmisid, name = item.split("|", 1)
-                    got = fetch_latest_measurements({"fmisid": fmisid})
-                    if got["t"] is not None:
-                        latest_t = got["t"]
-                        if i != 0:
-                            temp_fallback_station = name
-                        break
-
-                # Irradiance
-                for i, item in enumerate(IRR_MEAS_PLACES or []):
-                    fmisid, name = item.split("|", 1)
-                    got = fetch_latest_measurements({"fmisid": fmisid})
-                    if got["g"] is not None:
-                        latest_g = got["g"]
-                        if i != 0:
-                            irr_fallback_station = name
-                        break
-
-                temp_msg = build_temp_measurement_msg(TOPIC_TEMP_MEAS, temp_primary, latest_t, temp_fallback_station)
-                irr_msg  = build_irr_measurement_msg(TOPIC_IRR_MEAS,  irr_primary,  latest_g, irr_fallback_station)
-
-                publish_json(client, TOPIC_TEMP_MEAS, temp_msg)
-                publish_json(client, TOPIC_IRR_MEAS,  irr_msg)
-            except requests.HTTPError as e:
-                sys.stderr.write(f"HTTP error from FMI (observations): {e}\n")
-            except requests.RequestException as e:
-                sys.stderr.write(f"Network error (observations): {e}\n")
-
-            # 2) Forecasts (once per hour at hh:00)
-            now = datetime.now(timezone.utc)
-            if now.minute == 0 and now.hour != last_forecast_hour:
-                last_forecast_hour = now.hour
-                try:
-                    fc = fetch_hourly_forecast(loc, args.hours)
-                    temp_fc_msg = build_forecast_msg("Temperature", "Cel", TOPIC_TEMP_FC, location_str, fc["times"], fc["temp_vals"])
-                    irr_fc_msg  = build_forecast_msg("Irradiance", "W/m2", TOPIC_IRR_FC, location_str, fc["times"], fc["irr_vals"])
-                    publish_json(client, TOPIC_TEMP_FC, temp_fc_msg)
-                    publish_json(client, TOPIC_IRR_FC,  irr_fc_msg)
-                except requests.HTTPError as e:
-                    sys.stderr.write(f"HTTP error from FMI (forecast): {e}\n")
-                except requests.RequestException as e:
-                    sys.stderr.write(f"Network error (forecast): {e}\n")
+                publish_measurements(client, args.place or DEFAULT_PLACE)
+                return
+            # Prefetch: fetch now (ahead of the boundary), publish on the boundary
+            t0 = time.monotonic()
+            temp, irr = fetch_measurement_chains()
+            lead_est.observe(time.monotonic() - t0)
+            if not meas_job.wait_for_slot(slot):
+                return
+            lead_est.observe_publish(time.monotonic() - meas_job._mono_at(slot))
+            publish_measurements(client, args.place or DEFAULT_PLACE, temp, irr)
+        except requests.HTTPError as e:
+            sys.stderr.write(f"HTTP error from FMI (observations): {e}\n")
+        except requests.RequestException as e:
+            sys.stderr.write(f"Network error (observations): {e}\n")
+
+    def forecast_tick(_slot: datetime):
+        try:
+            publish_forecasts(client, fc_targets, args.hours)
+        except requests.HTTPError as e:
+            sys.stderr.write(f"HTTP error from FMI (forecast): {e}\n")
+        except requests.RequestException as e:
+            sys.stderr.write(f"Network error (forecast): {e}\n")
+
+    # Measurements every minute, forecasts once per hour at hh:00, on separate
+    # workers so a slow forecast never delays the next measurement (and an
+    # overrunning measurement can no longer make the hh:00 forecast be skipped)
+    meas_job = PeriodicJob("measurements", timedelta(minutes=1), measurement_tick,
+                           max_catchup=MEAS_MAX_CATCHUP,
+                           lead_fn=lead_est.lead if lead_est is not None else None)
+    jobs = [
+        meas_job,
+        PeriodicJob("forecast", timedelta(hours=1), forecast_tick),
+    ]
+    stop_evt = threading.Event()
+    # docker stop sends SIGTERM: shut down (flush / save unacked) like on Ctrl-C
+    signal.signal(signal.SIGTERM, lambda _signum, _frame: stop_evt.set())
+    try:
+        for job in jobs:
+            job.start()
+        while not stop_evt.wait(3600):
+            pass
     except KeyboardInterrupt:
         pass
     finally:
-        time.sleep(0.2)  # allow pending publishes to flush
-        client.loop_stop()
-        client.disconnect()
+        # Let running ticks finish publishing before the session and outbox close
+        for job in jobs:
+            job.stop(timeout=0)
+        t_end = time.monotonic() + MQTT_FLUSH_TIMEOUT
+        for job in jobs:
+            if not job.stop(max(0.0, t_end - time.monotonic())):
+                sys.stderr.write(f"[SCHED] {job.name}: tick still running after {MQTT_FLUSH_TIMEOUT:g}s, "
+                                 f"shutting down anyway\n")
+            job.report()
+        if lead_est is not None:
+            lead_est.report()
+        if MEAS_DEDUP:
+            print(f"[MQTT] delta publishing: {dedup_stats['published']} measurement messages published, "
+                  f"{dedup_stats['suppressed']} suppressed")
+        if OBS_ADAPTIVE_POLL:
+            print(f"[FMI] adaptive polling: {obs_poll_stats['requests']} observation requests, "
+                  f"{obs_poll_stats['skipped']} skipped")
+        shutdown(client)
 
 if __name__ == "__main__":
     try: